@@ -2,22 +2,47 @@
 
 from typing import List
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse
+from tortoise.functions import Count, Max
 
 from database.models import Bank
 from database.schemas import Bank_Pydantic, BankIn_Pydantic
+from services.http_cache import compute_etag, not_modified_response
 
 router = APIRouter(tags=["Banks"])
 
+# Columnas que se devuelven al serializar bancos directamente con orjson
+BANK_FIELDS = ("id", "name", "description", "created_at", "updated_at")
+
 @router.get("/banks", response_model=List[Bank_Pydantic])
-async def get_all_banks():
-    """Obtiene todos los bancos de la base de datos"""
-    return await Bank_Pydantic.from_queryset(Bank.all())
+async def get_all_banks(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+):
+    """Obtiene los bancos de la base de datos, paginados con skip/limit"""
+    # Si el cliente ya tiene esta versión del listado se responde 304 sin
+    # consultar ni serializar las filas
+    version = await Bank.annotate(
+        last_update=Max("updated_at"), total=Count("id")
+    ).first().values("last_update", "total")
+    etag = compute_etag(version["last_update"], version["total"], skip, limit)
+    cached = not_modified_response(request, etag)
+    if cached is not None:
+        return cached
+
+    # Se devuelven los valores tal cual vienen de la base de datos,
+    # evitando la doble validación de from_queryset
+    banks = await Bank.all().order_by("id").offset(skip).limit(limit).values(*BANK_FIELDS)
+    return ORJSONResponse(banks, headers={"ETag": etag})
 
 @router.get("/banks/{bank_id}", response_model=Bank_Pydantic)
 async def get_bank(bank_id: int):
     """Obtiene un banco por su ID"""
-    bank = await Bank.get_or_none(id=bank_id)
+    # Igual que el listado: la fila se serializa tal cual con orjson, sin
+    # construir ni revalidar el modelo Pydantic ni precargar relaciones
+    bank = await Bank.filter(id=bank_id).first().values(*BANK_FIELDS)
     if not bank:
         raise HTTPException(status_code=404, detail="Banco no encontrado")
-    return await Bank_Pydantic.from_tortoise_orm(bank)
\ No newline at end of file
+    return ORJSONResponse(bank)
\ No newline at end of file
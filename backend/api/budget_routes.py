@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import List, Optional
-from sqlalchemy.orm import Session
+
+import orjson
+from sqlalchemy import Float, and_, delete, exists, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
 # Cambiar a importaciones absolutas
-from database import get_db
+from database import AsyncSessionLocal, get_db, upsert_statement
 from models.budget import Budget, BudgetCategory, SubcategoryBudget
 from models.category import Category
+from services.http_cache import compute_etag, not_modified_response
 from schemas.budget_schema import (
     BudgetCreate, BudgetResponse, BudgetUpdate, BudgetDetailResponse,
     BudgetCategoryCreate, BudgetCategoryResponse,
@@ -16,9 +22,29 @@ router = APIRouter(
     tags=["budgets"]
 )
 
+# Consulta directa a la vista budget_vs_actual, construida una sola vez.
+# Los montos se tipan como Float para que SQLAlchemy convierta los
+# DECIMAL al leer las filas, sin casts fila a fila en Python
+BUDGET_VS_ACTUAL_SQL = text(
+    """
+    SELECT 
+        category_id, 
+        category_name,
+        budgeted_amount,
+        actual_spent,
+        difference
+    FROM budget_vs_actual
+    WHERE budget_id = :budget_id
+    """
+).columns(
+    budgeted_amount=Float,
+    actual_spent=Float,
+    difference=Float
+).execution_options(yield_per=200)
+
 # Endpoints para Presupuestos
 @router.post("/budgets", response_model=BudgetResponse)
-def create_budget(budget: BudgetCreate, db: Session = Depends(get_db)):
+async def create_budget(budget: BudgetCreate, db: AsyncSession = Depends(get_db)):
     db_budget = Budget(
         name=budget.name,
         description=budget.description,
@@ -26,90 +52,145 @@ def create_budget(budget: BudgetCreate, db: Session = Depends(get_db)):
         end_date=budget.end_date
     )
     db.add(db_budget)
-    db.commit()
-    db.refresh(db_budget)
+    await db.commit()
     return db_budget
 
 @router.get("/budgets", response_model=List[BudgetResponse])
-def get_budgets(
-    skip: int = 0, 
-    limit: int = 100, 
+async def get_budgets(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
     active_only: bool = False,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(Budget)
+    filters = []
+    today = None
     if active_only:
         from datetime import date
         today = date.today()
-        query = query.filter(Budget.start_date <= today, Budget.end_date >= today)
-    return query.offset(skip).limit(limit).all()
+        filters = [Budget.start_date <= today, Budget.end_date >= today]
+
+    # Si el cliente ya tiene esta versión del listado se responde 304 sin
+    # consultar ni serializar las filas
+    version = (await db.execute(
+        select(func.max(Budget.updated_at), func.count(Budget.id)).where(*filters)
+    )).one()
+    etag = compute_etag(*version, skip, limit, today)
+    cached = not_modified_response(request, etag)
+    if cached is not None:
+        return cached
+
+    # Seleccionar solo las columnas de la respuesta y serializarlas
+    # directamente con orjson, sin instanciar modelos ni revalidar
+    query = select(
+        Budget.id,
+        Budget.name,
+        Budget.description,
+        Budget.start_date,
+        Budget.end_date,
+        Budget.created_at,
+        Budget.updated_at
+    ).where(*filters)
+    rows = (await db.execute(query.offset(skip).limit(limit))).all()
+    return ORJSONResponse([dict(row._mapping) for row in rows], headers={"ETag": etag})
 
 @router.get("/{budget_id}", response_model=BudgetDetailResponse)
-def get_budget(budget_id: int, db: Session = Depends(get_db)):
-    budget = db.query(Budget).filter(Budget.id == budget_id).first()
+async def get_budget(budget_id: int, db: AsyncSession = Depends(get_db)):
+    budget = (await db.execute(
+        select(
+            Budget.id,
+            Budget.name,
+            Budget.description,
+            Budget.start_date,
+            Budget.end_date,
+            Budget.created_at,
+            Budget.updated_at
+        ).where(Budget.id == budget_id)
+    )).first()
     if not budget:
         raise HTTPException(status_code=404, detail="Presupuesto no encontrado")
     
     # Obtener categorías asociadas con sus subcategorías y montos
     result = {
-        **budget.__dict__,
+        **budget._mapping,
         "categories": [],
         "total_budgeted": 0
     }
     
-    # Obtener todas las categorías del presupuesto
-    budget_categories = db.query(
-        BudgetCategory.id,
-        BudgetCategory.category_id,
-        Category.name.label("category_name")
+    # Recorrer en una sola consulta recursiva las categorías principales
+    # asociadas al presupuesto y todos sus descendientes, junto con el monto
+    # de cada uno y el total presupuestado (función de ventana)
+    roots = select(
+        Category.id,
+        Category.name,
+        Category.parent_id,
+        BudgetCategory.id.label("budget_category_id")
     ).join(
-        Category, BudgetCategory.category_id == Category.id
-    ).filter(
+        BudgetCategory, BudgetCategory.category_id == Category.id
+    ).where(
         BudgetCategory.budget_id == budget_id,
         Category.parent_id == None  # Solo categorías principales
-    ).all()
-    
-    total_budgeted = 0
-    
-    # Para cada categoría, obtener sus subcategorías
-    for bc in budget_categories:
-        category_data = {
-            "id": bc.id,
-            "category_id": bc.category_id,
-            "category_name": bc.category_name,
-            "subcategories": []
-        }
-        
-        # Obtener subcategorías
-        subcategories = db.query(
-            Category.id,
-            Category.name,
-            SubcategoryBudget.amount
+    ).cte("tree", recursive=True)
+
+    child = aliased(Category)
+    parent = roots.alias()
+    tree = roots.union_all(
+        select(
+            child.id,
+            child.name,
+            child.parent_id,
+            parent.c.budget_category_id
+        ).join(parent, child.parent_id == parent.c.id)
+    )
+
+    rows = (await db.execute(
+        select(
+            tree.c.budget_category_id,
+            tree.c.id,
+            tree.c.name,
+            tree.c.parent_id,
+            SubcategoryBudget.amount,
+            func.sum(SubcategoryBudget.amount).over().label("total_budgeted")
         ).outerjoin(
             SubcategoryBudget,
-            (SubcategoryBudget.category_id == Category.id) &
-            (SubcategoryBudget.budget_id == budget_id)
-        ).filter(
-            Category.parent_id == bc.category_id
-        ).all()
-        
-        for subcat in subcategories:
-            amount = subcat.amount or 0
-            total_budgeted += amount
+            and_(
+                SubcategoryBudget.category_id == tree.c.id,
+                SubcategoryBudget.budget_id == budget_id
+            )
+        ).order_by(
+            tree.c.budget_category_id,
+            tree.c.parent_id.is_not(None),  # La categoría principal primero
+            tree.c.id
+        )
+    )).all()
+
+    total_budgeted = (rows[0].total_budgeted or 0) if rows else 0
+    categories = []
+    category_data = None
+
+    for row in rows:
+        if row.parent_id is None:
+            category_data = {
+                "id": row.budget_category_id,
+                "category_id": row.id,
+                "category_name": row.name,
+                "subcategories": []
+            }
+            categories.append(category_data)
+        else:
             category_data["subcategories"].append({
-                "id": subcat.id,
-                "name": subcat.name,
-                "amount": amount
+                "id": row.id,
+                "name": row.name,
+                "amount": row.amount or 0
             })
-            
-        result["categories"].append(category_data)
-    
+
+    result["categories"] = categories
     result["total_budgeted"] = total_budgeted
     return result
 
 @router.put("/{budget_id}", response_model=BudgetResponse)
-def update_budget(budget_id: int, budget: BudgetUpdate, db: Session = Depends(get_db)):
-    db_budget = db.query(Budget).filter(Budget.id == budget_id).first()
+async def update_budget(budget_id: int, budget: BudgetUpdate, db: AsyncSession = Depends(get_db)):
+    db_budget = await db.get(Budget, budget_id)
     if not db_budget:
         raise HTTPException(status_code=404, detail="Presupuesto no encontrado")
     
@@ -117,44 +198,53 @@ def update_budget(budget_id: int, budget: BudgetUpdate, db: Session = Depends(ge
     for key, value in update_data.items():
         setattr(db_budget, key, value)
     
-    db.commit()
-    db.refresh(db_budget)
+    await db.commit()
     return db_budget
 
 @router.delete("/{budget_id}", status_code=204)
-def delete_budget(budget_id: int, db: Session = Depends(get_db)):
-    db_budget = db.query(Budget).filter(Budget.id == budget_id).first()
+async def delete_budget(budget_id: int, db: AsyncSession = Depends(get_db)):
+    db_budget = await db.get(Budget, budget_id)
     if not db_budget:
         raise HTTPException(status_code=404, detail="Presupuesto no encontrado")
     
-    db.delete(db_budget)
-    db.commit()
+    await db.delete(db_budget)
+    await db.commit()
     return {"message": "Presupuesto eliminado"}
 
 # Endpoints para Categorías del Presupuesto
 @router.post("/{budget_id}/categories", response_model=BudgetCategoryResponse)
-def add_category_to_budget(budget_id: int, data: BudgetCategoryCreate, db: Session = Depends(get_db)):
-    # Verificar si el presupuesto existe
-    budget = db.query(Budget).filter(Budget.id == budget_id).first()
-    if not budget:
+async def add_category_to_budget(budget_id: int, data: BudgetCategoryCreate, db: AsyncSession = Depends(get_db)):
+    # Validar en una sola consulta el presupuesto, la categoría y si ya
+    # existe la asociación entre ambos
+    row = (await db.execute(select(
+        Budget.id.label("budget_id"),
+        Category.id.label("category_id"),
+        Category.name.label("category_name"),
+        Category.parent_id,
+        exists().where(
+            BudgetCategory.budget_id == budget_id,
+            BudgetCategory.category_id == data.category_id
+        ).label("already_associated")
+    ).select_from(
+        Budget
+    ).outerjoin(
+        Category, Category.id == data.category_id
+    ).where(
+        Budget.id == budget_id
+    ))).first()
+
+    if row is None:
         raise HTTPException(status_code=404, detail="Presupuesto no encontrado")
     
-    # Verificar si la categoría existe
-    category = db.query(Category).filter(Category.id == data.category_id).first()
-    if not category:
+    if row.category_id is None:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
     
     # Verificar que la categoría no esté ya asociada al presupuesto
-    exists = db.query(BudgetCategory).filter(
-        BudgetCategory.budget_id == budget_id,
-        BudgetCategory.category_id == data.category_id
-    ).first()
-    
-    if exists:
+    if row.already_associated:
         raise HTTPException(status_code=400, detail="Esta categoría ya está asociada al presupuesto")
     
     # Verificar que sea una categoría principal y no una subcategoría
-    if category.parent_id is not None:
+    if row.parent_id is not None:
         raise HTTPException(
             status_code=400, 
             detail="Solo se pueden asociar categorías principales al presupuesto"
@@ -167,118 +257,142 @@ def add_category_to_budget(budget_id: int, data: BudgetCategoryCreate, db: Sessi
     )
     
     db.add(db_budget_category)
-    db.commit()
-    db.refresh(db_budget_category)
+    await db.commit()
     
     # Enriquecer la respuesta con el nombre de la categoría
-    result = {
-        **db_budget_category.__dict__,
-        "category_name": category.name
+    return {
+        "id": db_budget_category.id,
+        "budget_id": db_budget_category.budget_id,
+        "category_id": db_budget_category.category_id,
+        "category_name": row.category_name,
+        "created_at": db_budget_category.created_at
     }
-    
-    return result
 
 @router.delete("/{budget_id}/categories/{category_id}", status_code=204)
-def remove_category_from_budget(budget_id: int, category_id: int, db: Session = Depends(get_db)):
-    # Verificar si existe la asociación
-    db_budget_category = db.query(BudgetCategory).filter(
-        BudgetCategory.budget_id == budget_id,
-        BudgetCategory.category_id == category_id
-    ).first()
+async def remove_category_from_budget(budget_id: int, category_id: int, db: AsyncSession = Depends(get_db)):
+    # Eliminar la asociación; el número de filas afectadas indica si existía
+    result = await db.execute(
+        delete(BudgetCategory).where(
+            BudgetCategory.budget_id == budget_id,
+            BudgetCategory.category_id == category_id
+        )
+    )
     
-    if not db_budget_category:
+    if not result.rowcount:
         raise HTTPException(
             status_code=404,
             detail="Categoría no asociada a este presupuesto"
         )
     
-    # Eliminar todos los presupuestos de subcategorías asociados
-    subcategories = db.query(Category).filter(Category.parent_id == category_id).all()
-    for subcategory in subcategories:
-        db.query(SubcategoryBudget).filter(
+    # Eliminar en una sola sentencia todos los presupuestos de subcategorías asociados
+    await db.execute(
+        delete(SubcategoryBudget).where(
             SubcategoryBudget.budget_id == budget_id,
-            SubcategoryBudget.category_id == subcategory.id
-        ).delete()
+            SubcategoryBudget.category_id.in_(
+                select(Category.id).where(Category.parent_id == category_id)
+            )
+        ).execution_options(synchronize_session=False)
+    )
     
-    # Eliminar la asociación
-    db.delete(db_budget_category)
-    db.commit()
+    await db.commit()
     
     return {"message": "Categoría eliminada del presupuesto"}
 
 # Endpoints para Subcategorías/Montos del Presupuesto
 @router.post("/{budget_id}/subcategories", response_model=SubcategoryBudgetResponse)
-def set_subcategory_budget(budget_id: int, data: SubcategoryBudgetCreate, db: Session = Depends(get_db)):
-    # Verificar si el presupuesto existe
-    budget = db.query(Budget).filter(Budget.id == budget_id).first()
-    if not budget:
+async def set_subcategory_budget(budget_id: int, data: SubcategoryBudgetCreate, db: AsyncSession = Depends(get_db)):
+    # Validar en una sola consulta el presupuesto, la subcategoría, su
+    # categoría padre y si esta última está asociada al presupuesto
+    parent = aliased(Category)
+    row = (await db.execute(select(
+        Budget.id.label("budget_id"),
+        Category.id.label("subcategory_id"),
+        Category.name.label("subcategory_name"),
+        Category.parent_id,
+        parent.name.label("category_name"),
+        exists().where(
+            BudgetCategory.budget_id == budget_id,
+            BudgetCategory.category_id == Category.parent_id
+        ).label("parent_associated")
+    ).select_from(
+        Budget
+    ).outerjoin(
+        Category, Category.id == data.category_id
+    ).outerjoin(
+        parent, parent.id == Category.parent_id
+    ).where(
+        Budget.id == budget_id
+    ))).first()
+
+    if row is None:
         raise HTTPException(status_code=404, detail="Presupuesto no encontrado")
-    
-    # Verificar si la subcategoría existe
-    subcategory = db.query(Category).filter(Category.id == data.category_id).first()
-    if not subcategory:
+
+    if row.subcategory_id is None:
         raise HTTPException(status_code=404, detail="Subcategoría no encontrada")
     
     # Verificar que sea una subcategoría
-    if subcategory.parent_id is None:
+    if row.parent_id is None:
         raise HTTPException(
             status_code=400,
             detail="Solo se pueden asignar montos a subcategorías, no a categorías principales"
         )
     
     # Verificar que la categoría padre esté asociada al presupuesto
-    parent_associated = db.query(BudgetCategory).filter(
-        BudgetCategory.budget_id == budget_id,
-        BudgetCategory.category_id == subcategory.parent_id
-    ).first()
-    
-    if not parent_associated:
+    if not row.parent_associated:
         raise HTTPException(
             status_code=400,
             detail="La categoría padre debe estar asociada al presupuesto primero"
         )
     
-    # Verificar si ya existe un presupuesto para esta subcategoría
-    existing = db.query(SubcategoryBudget).filter(
-        SubcategoryBudget.budget_id == budget_id,
-        SubcategoryBudget.category_id == data.category_id
-    ).first()
-    
-    if existing:
-        # Actualizar el existente
-        existing.amount = data.amount
-        db.commit()
-        db.refresh(existing)
-        result = existing
-    else:
-        # Crear nuevo
-        db_subcategory_budget = SubcategoryBudget(
-            budget_id=budget_id,
-            category_id=data.category_id,
-            amount=data.amount
+    # Crear o actualizar el monto en una sola sentencia (UPSERT sobre la
+    # restricción única budget_id + category_id)
+    await db.execute(upsert_statement(
+        db,
+        SubcategoryBudget,
+        values={
+            "budget_id": budget_id,
+            "category_id": data.category_id,
+            "amount": data.amount
+        },
+        conflict_columns=["budget_id", "category_id"],
+        update_values={"amount": data.amount, "updated_at": func.now()}
+    ))
+    await db.commit()
+
+    saved = (await db.execute(
+        select(
+            SubcategoryBudget.id,
+            SubcategoryBudget.created_at,
+            SubcategoryBudget.updated_at
+        ).where(
+            SubcategoryBudget.budget_id == budget_id,
+            SubcategoryBudget.category_id == data.category_id
         )
-        db.add(db_subcategory_budget)
-        db.commit()
-        db.refresh(db_subcategory_budget)
-        result = db_subcategory_budget
+    )).one()
     
     # Enriquecer la respuesta con nombres
     return {
-        **result.__dict__,
-        "subcategory_name": subcategory.name,
-        "category_id": subcategory.parent_id,
-        "category_name": db.query(Category.name).filter(Category.id == subcategory.parent_id).scalar()
+        "id": saved.id,
+        "budget_id": budget_id,
+        "amount": data.amount,
+        "created_at": saved.created_at,
+        "updated_at": saved.updated_at,
+        "subcategory_name": row.subcategory_name,
+        "category_id": row.parent_id,
+        "category_name": row.category_name
     }
 
 @router.put("/{budget_id}/subcategories/{subcategory_id}", response_model=SubcategoryBudgetResponse)
-def update_subcategory_budget(
-    budget_id: int, subcategory_id: int, data: SubcategoryBudgetCreate, db: Session = Depends(get_db)
+async def update_subcategory_budget(
+    budget_id: int, subcategory_id: int, data: SubcategoryBudgetCreate, db: AsyncSession = Depends(get_db)
 ):
     # Verificar si existe
-    db_subcategory_budget = db.query(SubcategoryBudget).filter(
-        SubcategoryBudget.budget_id == budget_id,
-        SubcategoryBudget.category_id == subcategory_id
-    ).first()
+    db_subcategory_budget = await db.scalar(
+        select(SubcategoryBudget).where(
+            SubcategoryBudget.budget_id == budget_id,
+            SubcategoryBudget.category_id == subcategory_id
+        )
+    )
     
     if not db_subcategory_budget:
         raise HTTPException(
@@ -288,67 +402,60 @@ def update_subcategory_budget(
     
     # Actualizar monto
     db_subcategory_budget.amount = data.amount
-    db.commit()
-    db.refresh(db_subcategory_budget)
+    await db.commit()
     
     # Obtener información de la subcategoría
-    subcategory = db.query(Category).filter(Category.id == subcategory_id).first()
+    subcategory = await db.get(Category, subcategory_id)
     
     # Enriquecer la respuesta
     return {
-        **db_subcategory_budget.__dict__,
+        "id": db_subcategory_budget.id,
+        "budget_id": db_subcategory_budget.budget_id,
+        "amount": db_subcategory_budget.amount,
+        "created_at": db_subcategory_budget.created_at,
+        "updated_at": db_subcategory_budget.updated_at,
         "subcategory_name": subcategory.name,
         "category_id": subcategory.parent_id,
-        "category_name": db.query(Category.name).filter(Category.id == subcategory.parent_id).scalar()
+        "category_name": await db.scalar(select(Category.name).where(Category.id == subcategory.parent_id))
     }
 
 @router.delete("/{budget_id}/subcategories/{subcategory_id}", status_code=204)
-def delete_subcategory_budget(budget_id: int, subcategory_id: int, db: Session = Depends(get_db)):
-    deleted = db.query(SubcategoryBudget).filter(
-        SubcategoryBudget.budget_id == budget_id,
-        SubcategoryBudget.category_id == subcategory_id
-    ).delete()
+async def delete_subcategory_budget(budget_id: int, subcategory_id: int, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(
+        delete(SubcategoryBudget).where(
+            SubcategoryBudget.budget_id == budget_id,
+            SubcategoryBudget.category_id == subcategory_id
+        )
+    )
     
-    if not deleted:
+    if not result.rowcount:
         raise HTTPException(
             status_code=404,
             detail="No hay presupuesto asignado para esta subcategoría"
         )
     
-    db.commit()
+    await db.commit()
     return {"message": "Presupuesto de subcategoría eliminado"}
 
 # Endpoint para obtener el reporte comparativo
 @router.get("/{budget_id}/vs-actual", response_model=List[BudgetVsActualResponse])
-def get_budget_vs_actual(budget_id: int, db: Session = Depends(get_db)):
+async def get_budget_vs_actual(budget_id: int, db: AsyncSession = Depends(get_db)):
     # Verificar si el presupuesto existe
-    budget = db.query(Budget).filter(Budget.id == budget_id).first()
+    budget = await db.get(Budget, budget_id)
     if not budget:
         raise HTTPException(status_code=404, detail="Presupuesto no encontrado")
     
-    # Ejecutar consulta SQL directa a la vista budget_vs_actual
-    from sqlalchemy import text
-    result = db.execute(text(
-        """
-        SELECT 
-            category_id, 
-            category_name,
-            budgeted_amount,
-            actual_spent,
-            difference
-        FROM budget_vs_actual
-        WHERE budget_id = :budget_id
-        """
-    ), {"budget_id": budget_id}).fetchall()
-    
-    # Convertir resultados de la consulta a la estructura esperada
-    return [
-        {
-            "category_id": row[0],
-            "category_name": row[1],
-            "budgeted_amount": float(row[2]) if row[2] is not None else 0.0,
-            "actual_spent": float(row[3]) if row[3] is not None else 0.0,
-            "difference": float(row[4]) if row[4] is not None else 0.0
-        }
-        for row in result
-    ]
+    async def stream_rows():
+        # El streaming continúa después de que el endpoint retorna, así que
+        # usa su propia sesión en lugar de la de la dependencia
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(BUDGET_VS_ACTUAL_SQL, {"budget_id": budget_id})
+            yield b"["
+            first = True
+            # La vista ya aplica COALESCE sobre los montos
+            async for row in result.mappings():
+                yield (b"" if first else b",") + orjson.dumps(dict(row))
+                first = False
+            yield b"]"
+    
+    return StreamingResponse(stream_rows(), media_type="application/json")
@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import ORJSONResponse
 from typing import List, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import delete, exists, func, insert, or_, select, text, true
+from sqlalchemy.orm import joinedload, raiseload
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Cambiar a importaciones absolutas
 from database import get_db
-from models.category import Category
+from models.category import Category, CategoryKeyword
 from models.transaction import Transaction
 from models.budget import BudgetCategory, SubcategoryBudget
+from services.http_cache import compute_etag, not_modified_response
 from schemas.category_schema import (
     CategoryCreate, CategoryResponse, CategoryUpdate,
     SubcategoryCreate, SubcategoryResponse, SubcategoryUpdate,
@@ -19,54 +22,87 @@ router = APIRouter(
     tags=["categories"]
 )
 
+# Sentencia SQL construida una sola vez al cargar el módulo
+DELETE_KEYWORD_SQL = text(
+    """
+    DELETE FROM category_keywords
+    WHERE id = :keyword_id
+    """
+)
+
 # Endpoints para Categorías principales
 @router.post("/", response_model=CategoryResponse)
-def create_category(category: CategoryCreate, db: Session = Depends(get_db)):
+async def create_category(category: CategoryCreate, db: AsyncSession = Depends(get_db)):
     db_category = Category(
         name=category.name,
         description=category.description,
         parent_id=None  # Asegurar que sea una categoría principal
     )
     db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
+    await db.commit()
     return db_category
 
 @router.get("/", response_model=List[CategoryResponse])
-def get_categories(
-    skip: int = 0, 
-    limit: int = 100, 
-    db: Session = Depends(get_db)
+async def get_categories(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(Category).filter(Category.parent_id == None)  # Solo categorías principales
-    return query.offset(skip).limit(limit).all()
+    # Si el cliente ya tiene esta versión del listado se responde 304 sin
+    # consultar ni serializar las filas
+    version = (await db.execute(
+        select(func.max(Category.updated_at), func.count(Category.id)).where(Category.parent_id == None)
+    )).one()
+    etag = compute_etag(*version, skip, limit)
+    cached = not_modified_response(request, etag)
+    if cached is not None:
+        return cached
+
+    query = select(
+        Category.id,
+        Category.name,
+        Category.description,
+        Category.created_at,
+        Category.updated_at
+    ).where(Category.parent_id == None)  # Solo categorías principales
+    rows = (await db.execute(query.offset(skip).limit(limit))).all()
+    return ORJSONResponse([dict(row._mapping) for row in rows], headers={"ETag": etag})
 
 # La ruta especial para subcategorías debería estar antes que la ruta con parámetros
 # para evitar conflictos de interpretación
 
 # Reordenar las rutas para que las más específicas estén primero
 @router.get("/subcategory/{subcategory_id}", response_model=SubcategoryResponse)
-def get_subcategory(subcategory_id: int, db: Session = Depends(get_db)):
-    subcategory = db.query(Category).filter(Category.id == subcategory_id).filter(Category.parent_id != None).first()
+async def get_subcategory(subcategory_id: int, db: AsyncSession = Depends(get_db)):
+    # La categoría padre se carga en la misma consulta con un JOIN; raiseload
+    # hace fallar cualquier otro acceso perezoso en vez de lanzar consultas extra
+    subcategory = await db.scalar(
+        select(Category).options(joinedload(Category.parent), raiseload("*")).where(
+            Category.id == subcategory_id, Category.parent_id != None
+        )
+    )
     if not subcategory:
         raise HTTPException(status_code=404, detail="Subcategoría no encontrada")
     
-    # Obtener el nombre de la categoría padre
-    parent = db.query(Category).filter(Category.id == subcategory.parent_id).first()
-    
     return {
         "id": subcategory.id,
         "name": subcategory.name,
         "description": subcategory.description,
         "parent_id": subcategory.parent_id,
-        "parent_name": parent.name if parent else None,
+        "parent_name": subcategory.parent.name,
         "created_at": subcategory.created_at,
         "updated_at": subcategory.updated_at
     }
 
 @router.put("/subcategory/{subcategory_id}", response_model=SubcategoryResponse)
-def update_subcategory(subcategory_id: int, subcategory: SubcategoryUpdate, db: Session = Depends(get_db)):
-    db_subcategory = db.query(Category).filter(Category.id == subcategory_id, Category.parent_id != None).first()
+async def update_subcategory(subcategory_id: int, subcategory: SubcategoryUpdate, db: AsyncSession = Depends(get_db)):
+    # La categoría padre se carga en la misma consulta con un JOIN
+    db_subcategory = await db.scalar(
+        select(Category).options(joinedload(Category.parent), raiseload("*")).where(
+            Category.id == subcategory_id, Category.parent_id != None
+        )
+    )
     if not db_subcategory:
         raise HTTPException(status_code=404, detail="Subcategoría no encontrada")
     
@@ -76,76 +112,61 @@ def update_subcategory(subcategory_id: int, subcategory: SubcategoryUpdate, db:
     for key, value in update_data.items():
         setattr(db_subcategory, key, value)
     
-    db.commit()
-    db.refresh(db_subcategory)
-    
-    # Obtener el nombre de la categoría padre
-    parent = db.query(Category).filter(Category.id == db_subcategory.parent_id).first()
+    await db.commit()
     
     return {
         "id": db_subcategory.id,
         "name": db_subcategory.name,
         "description": db_subcategory.description,
         "parent_id": db_subcategory.parent_id,
-        "parent_name": parent.name if parent else None,
+        "parent_name": db_subcategory.parent.name,
         "created_at": db_subcategory.created_at,
         "updated_at": db_subcategory.updated_at
     }
 
 @router.delete("/subcategory/{subcategory_id}", status_code=204)
-def delete_subcategory(subcategory_id: int, db: Session = Depends(get_db)):
+async def delete_subcategory(subcategory_id: int, db: AsyncSession = Depends(get_db)):
     # Verificar si hay presupuestos o transacciones que usen esta subcategoría
     # (Esta verificación depende de la estructura exacta de tus modelos)
     
-    db_subcategory = db.query(Category).filter(Category.id == subcategory_id, Category.parent_id != None).first()
-    if not db_subcategory:
+    # Eliminar en una sola sentencia; el número de filas afectadas indica si existía
+    result = await db.execute(
+        delete(Category).where(Category.id == subcategory_id, Category.parent_id != None)
+    )
+    if not result.rowcount:
         raise HTTPException(status_code=404, detail="Subcategoría no encontrada")
     
-    db.delete(db_subcategory)
-    db.commit()
+    await db.commit()
     return {"message": "Subcategoría eliminada"}
 
 @router.post("/subcategory/{subcategory_id}/keywords", response_model=CategoryKeywordResponse)
-def add_category_keyword(subcategory_id: int, keyword: CategoryKeywordCreate, db: Session = Depends(get_db)):
+async def add_category_keyword(subcategory_id: int, keyword: CategoryKeywordCreate, db: AsyncSession = Depends(get_db)):
     # Verificar si la subcategoría existe
-    subcategory = db.query(Category).filter(Category.id == subcategory_id, Category.parent_id != None).first()
+    subcategory = await db.scalar(
+        select(Category).options(raiseload("*")).where(Category.id == subcategory_id, Category.parent_id != None)
+    )
     if not subcategory:
         raise HTTPException(status_code=404, detail="Subcategoría no encontrada")
     
-    # Verificar si la palabra clave ya existe para esta categoría
-    from sqlalchemy import text
-    existing = db.execute(text(
-        "SELECT id FROM category_keywords WHERE category_id = :category_id AND keyword = :keyword"
-    ), {
-        "category_id": subcategory_id,
-        "keyword": keyword.keyword
-    }).fetchone()
+    # Insertar ignorando duplicados: la clave única (category_id, keyword) decide
+    # en una sola sentencia si la palabra clave ya existía
+    result = await db.execute(
+        insert(CategoryKeyword).values(
+            category_id=subcategory_id,
+            keyword=keyword.keyword
+        ).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+    )
     
-    if existing:
+    if result.rowcount == 0:
+        await db.rollback()
         raise HTTPException(
             status_code=400,
             detail="Esta palabra clave ya existe para esta categoría"
         )
     
-    # Insertar la palabra clave
-    result = db.execute(text(
-        """
-        INSERT INTO category_keywords (category_id, keyword)
-        VALUES (:category_id, :keyword)
-        """
-    ), {
-        "category_id": subcategory_id,
-        "keyword": keyword.keyword
-    })
-    
-    db.commit()
-    
-    # Obtener el ID recién creado
-    new_id = db.execute(text(
-        """
-        SELECT LAST_INSERT_ID() as id
-        """
-    )).fetchone()[0]
+    # El ID generado viene con el propio resultado del INSERT
+    new_id = result.inserted_primary_key[0]
+    await db.commit()
     
     return {
         "id": new_id,
@@ -155,55 +176,69 @@ def add_category_keyword(subcategory_id: int, keyword: CategoryKeywordCreate, db
     }
 
 @router.get("/subcategory/{subcategory_id}/keywords", response_model=List[CategoryKeywordResponse])
-def get_category_keywords(subcategory_id: int, db: Session = Depends(get_db)):
-    # Verificar si la subcategoría existe
-    subcategory = db.query(Category).filter(Category.id == subcategory_id, Category.parent_id != None).first()
-    if not subcategory:
-        raise HTTPException(status_code=404, detail="Subcategoría no encontrada")
+async def get_category_keywords(
+    subcategory_id: int,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_db)
+):
+    # Una sola consulta: la subcategoría unida (LEFT JOIN) a la página de sus
+    # palabras clave. Si no hay filas la subcategoría no existe; si existe pero
+    # no tiene palabras clave en la página, llega una fila con la clave en NULL
+    page = select(
+        CategoryKeyword.id,
+        CategoryKeyword.keyword
+    ).where(
+        CategoryKeyword.category_id == subcategory_id
+    ).order_by(CategoryKeyword.id).offset(skip).limit(limit).subquery()
     
-    # Obtener todas las palabras clave
-    from sqlalchemy import text
-    keywords = db.execute(text(
-        """
-        SELECT id, category_id, keyword
-        FROM category_keywords
-        WHERE category_id = :category_id
-        """
-    ), {"category_id": subcategory_id}).fetchall()
+    rows = (await db.execute(
+        select(
+            Category.name,
+            page.c.id,
+            page.c.keyword
+        ).select_from(
+            Category
+        ).outerjoin(
+            page, true()
+        ).where(
+            Category.id == subcategory_id, Category.parent_id != None
+        ).order_by(page.c.id)
+    )).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Subcategoría no encontrada")
     
     return [{
-        "id": keyword[0],
-        "category_id": keyword[1],
-        "keyword": keyword[2],
-        "category_name": subcategory.name
-    } for keyword in keywords]
+        "id": row.id,
+        "category_id": subcategory_id,
+        "keyword": row.keyword,
+        "category_name": row.name
+    } for row in rows if row.id is not None]
 
 @router.delete("/keywords/{keyword_id}", status_code=204)
-def delete_category_keyword(keyword_id: int, db: Session = Depends(get_db)):
-    from sqlalchemy import text
-    result = db.execute(text(
-        """
-        DELETE FROM category_keywords
-        WHERE id = :keyword_id
-        """
-    ), {"keyword_id": keyword_id})
+async def delete_category_keyword(keyword_id: int, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(DELETE_KEYWORD_SQL, {"keyword_id": keyword_id})
     
     if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Palabra clave no encontrada")
     
-    db.commit()
+    await db.commit()
     return {"message": "Palabra clave eliminada"}
 
 @router.get("/{category_id}", response_model=CategoryResponse)
-def get_category(category_id: int, db: Session = Depends(get_db)):
-    category = db.query(Category).filter(Category.id == category_id, Category.parent_id == None).first()
+async def get_category(category_id: int, db: AsyncSession = Depends(get_db)):
+    category = await db.scalar(
+        select(Category).options(raiseload("*")).where(Category.id == category_id, Category.parent_id == None)
+    )
     if not category:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
     return category
 
 @router.put("/{category_id}", response_model=CategoryResponse)
-def update_category(category_id: int, category: CategoryUpdate, db: Session = Depends(get_db)):
-    db_category = db.query(Category).filter(Category.id == category_id, Category.parent_id == None).first()
+async def update_category(category_id: int, category: CategoryUpdate, db: AsyncSession = Depends(get_db)):
+    db_category = await db.scalar(
+        select(Category).options(raiseload("*")).where(Category.id == category_id, Category.parent_id == None)
+    )
     if not db_category:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
     
@@ -215,33 +250,46 @@ def update_category(category_id: int, category: CategoryUpdate, db: Session = De
     for key, value in update_data.items():
         setattr(db_category, key, value)
     
-    db.commit()
-    db.refresh(db_category)
+    await db.commit()
     return db_category
 
 @router.delete("/{category_id}", status_code=204)
-def delete_category(category_id: int, db: Session = Depends(get_db)):
-    # Primero verificar si hay subcategorías dependientes
-    subcategories = db.query(Category).filter(Category.parent_id == category_id).count()
-    if subcategories > 0:
+async def delete_category(category_id: int, db: AsyncSession = Depends(get_db)):
+    # Verificar en una sola consulta si la categoría está en uso. Cada EXISTS
+    # se detiene en la primera fila encontrada, sin contar todas
+    usage = (await db.execute(
+        select(
+            exists().where(Category.parent_id == category_id).label("has_subcategories"),
+            exists().where(Transaction.subcategory_id == category_id).label("has_transactions")
+        )
+    )).one()
+    if usage.has_subcategories:
         raise HTTPException(
             status_code=400, 
             detail="No se puede eliminar una categoría con subcategorías. Elimine primero las subcategorías."
         )
+    if usage.has_transactions:
+        raise HTTPException(
+            status_code=400,
+            detail="No se puede eliminar una categoría con transacciones asociadas."
+        )
     
-    db_category = db.query(Category).filter(Category.id == category_id, Category.parent_id == None).first()
-    if not db_category:
+    result = await db.execute(
+        delete(Category).where(Category.id == category_id, Category.parent_id == None)
+    )
+    if not result.rowcount:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
     
-    db.delete(db_category)
-    db.commit()
+    await db.commit()
     return {"message": "Categoría eliminada"}
 
 # Endpoints para Subcategorías
 @router.post("/{parent_id}/subcategories", response_model=SubcategoryResponse)
-def create_subcategory(parent_id: int, subcategory: SubcategoryCreate, db: Session = Depends(get_db)):
+async def create_subcategory(parent_id: int, subcategory: SubcategoryCreate, db: AsyncSession = Depends(get_db)):
     # Verificar si la categoría padre existe
-    parent = db.query(Category).filter(Category.id == parent_id, Category.parent_id == None).first()
+    parent = await db.scalar(
+        select(Category).options(raiseload("*")).where(Category.id == parent_id, Category.parent_id == None)
+    )
     if not parent:
         raise HTTPException(status_code=404, detail="Categoría padre no encontrada")
     
@@ -251,8 +299,7 @@ def create_subcategory(parent_id: int, subcategory: SubcategoryCreate, db: Sessi
         parent_id=parent_id
     )
     db.add(db_subcategory)
-    db.commit()
-    db.refresh(db_subcategory)
+    await db.commit()
     
     # Enriquecer la respuesta con el nombre de la categoría padre
     response_dict = {
@@ -267,29 +314,36 @@ def create_subcategory(parent_id: int, subcategory: SubcategoryCreate, db: Sessi
     return response_dict
 
 @router.get("/{parent_id}/subcategories", response_model=List[SubcategoryResponse])
-def get_subcategories(
+async def get_subcategories(
     parent_id: int, 
-    skip: int = 0, 
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_db)
 ):
     # Verificar si la categoría padre existe
-    parent = db.query(Category).filter(Category.id == parent_id, Category.parent_id == None).first()
+    parent = await db.scalar(
+        select(Category).options(raiseload("*")).where(Category.id == parent_id, Category.parent_id == None)
+    )
     if not parent:
         raise HTTPException(status_code=404, detail="Categoría padre no encontrada")
     
-    subcategories = db.query(Category).filter(Category.parent_id == parent_id).offset(skip).limit(limit).all()
+    subcategories = (await db.execute(
+        select(
+            Category.id,
+            Category.name,
+            Category.description,
+            Category.parent_id,
+            Category.created_at,
+            Category.updated_at
+        ).where(
+            Category.parent_id == parent_id
+        ).offset(skip).limit(limit)
+    )).all()
     
     # Enriquecer la respuesta con el nombre de la categoría padre
     result = []
     for subcategory in subcategories:
-        result.append({
-            "id": subcategory.id,
-            "name": subcategory.name,
-            "description": subcategory.description,
-            "parent_id": subcategory.parent_id,
-            "parent_name": parent.name,
-            "created_at": subcategory.created_at,
-            "updated_at": subcategory.updated_at
-        })
-    return result
+        item = dict(subcategory._mapping)
+        item["parent_name"] = parent.name
+        result.append(item)
+    return ORJSONResponse(result)
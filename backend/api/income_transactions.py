@@ -2,21 +2,36 @@
 
 import logging
 from typing import List, Optional
-from datetime import date, datetime
 
 from fastapi import APIRouter, HTTPException, Query, Body
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-import calendar
+from tortoise.expressions import RawSQL
 
 from database.models import IncomeTransaction
 from database.schemas import IncomeTransaction_Pydantic, IncomeTransactionIn_Pydantic
+from services.date_parsing import parse_date
+from services.date_ranges import month_range
+from services.transaction_keys import insert_new_rows
 
 router = APIRouter(tags=["Income Transactions"])
 
+# Columnas de una transacción de ingreso que se devuelven sin pasar por el modelo Pydantic
+INCOME_TRANSACTION_FIELDS = (
+    "id", "transaction_date", "description", "amount", "category",
+    "bank_id", "created_at", "updated_at"
+)
+
+def income_transaction_to_dict(transaction: IncomeTransaction) -> dict:
+    """Convierte una instancia ya cargada en el diccionario de respuesta, sin consultas adicionales"""
+    return {field: getattr(transaction, field) for field in INCOME_TRANSACTION_FIELDS}
+
 @router.get("/income-transactions", response_model=List[IncomeTransaction_Pydantic])
 async def get_all_income_transactions():
     """Obtiene todas las transacciones de ingresos"""
-    return await IncomeTransaction_Pydantic.from_queryset(IncomeTransaction.all())
+    # Solo las columnas de la respuesta; FastAPI las valida en una sola pasada
+    # contra response_model, sin construir un modelo por fila con from_queryset
+    return await IncomeTransaction.all().values(*INCOME_TRANSACTION_FIELDS)
 
 @router.get("/income-transactions/{transaction_id}", response_model=IncomeTransaction_Pydantic)
 async def get_income_transaction(transaction_id: int):
@@ -24,7 +39,7 @@ async def get_income_transaction(transaction_id: int):
     transaction = await IncomeTransaction.get_or_none(id=transaction_id)
     if not transaction:
         raise HTTPException(status_code=404, detail="Transacción de ingreso no encontrada")
-    return await IncomeTransaction_Pydantic.from_tortoise_orm(transaction)
+    return income_transaction_to_dict(transaction)
 
 @router.post("/income-transactions", response_model=IncomeTransaction_Pydantic)
 async def create_income_transaction(transaction: IncomeTransactionIn_Pydantic):
@@ -35,7 +50,9 @@ async def create_income_transaction(transaction: IncomeTransactionIn_Pydantic):
         transaction_dict["amount"] = abs(transaction_dict["amount"])
         
     transaction_obj = await IncomeTransaction.create(**transaction_dict)
-    return await IncomeTransaction_Pydantic.from_tortoise_orm(transaction_obj)
+    # create() ya devuelve la instancia completa (con ID); el modelo no tiene
+    # relaciones que precargar, así que se responde con sus campos directamente
+    return income_transaction_to_dict(transaction_obj)
 
 @router.put("/income-transactions/{transaction_id}", response_model=IncomeTransaction_Pydantic)
 async def update_income_transaction(transaction_id: int, transaction: IncomeTransactionIn_Pydantic):
@@ -51,7 +68,7 @@ async def update_income_transaction(transaction_id: int, transaction: IncomeTran
     
     await transaction_obj.update_from_dict(transaction_data)
     await transaction_obj.save()
-    return await IncomeTransaction_Pydantic.from_tortoise_orm(transaction_obj)
+    return income_transaction_to_dict(transaction_obj)
 
 @router.delete("/income-transactions/{transaction_id}")
 async def delete_income_transaction(transaction_id: int):
@@ -76,27 +93,25 @@ async def get_income_transactions_by_month(
         Lista de transacciones de ingreso correspondientes al mes y año especificados.
     """
     try:
-        # Calcular el último día del mes
-        last_day = calendar.monthrange(year, month)[1]
-        
-        # Crear fechas de inicio y fin para el filtro
-        start_date = date(year, month, 1)
-        end_date = date(year, month, last_day)
+        # Rango semiabierto del mes: desde el día 1 hasta el día 1 del mes siguiente
+        start_date, end_date = month_range(year, month)
         
         # Filtrar transacciones por el rango de fechas
         query = IncomeTransaction.filter(
             transaction_date__gte=start_date,
-            transaction_date__lte=end_date
+            transaction_date__lt=end_date
         ).order_by('transaction_date')
         
-        # Obtener transacciones
-        transactions = await IncomeTransaction_Pydantic.from_queryset(query)
-        
-        # Eliminar decimales en el campo amount para consistencia con el frontend
-        for transaction in transactions:
-            transaction.amount = int(transaction.amount)
+        # Obtener solo las columnas de la respuesta. Los decimales de amount se
+        # eliminan en la propia consulta (consistencia con el frontend), así
+        # que la base de datos ya entrega enteros
+        fields = [field for field in INCOME_TRANSACTION_FIELDS if field != "amount"]
+        transactions = await query.annotate(
+            amount_int=RawSQL("CAST(TRUNCATE(amount, 0) AS SIGNED)")
+        ).values(*fields, amount="amount_int")
         
-        return transactions
+        # Se serializa directamente para que amount llegue como número entero
+        return ORJSONResponse(transactions)
     
     except Exception as e:
         logging.error(f"Error al obtener transacciones de ingreso por mes: {str(e)}", exc_info=True)
@@ -135,18 +150,11 @@ async def create_bulk_income_transactions(transactions: List[IncomeTransactionIn
     
     # Convertimos todas las fechas al formato de la base de datos
     processed_transactions = []
+    date_format = None  # Formato detectado en la primera fila, reutilizado en las siguientes
     for t in transactions:
         # Convertir la fecha si viene como string
         try:
-            # Intentar varios formatos de fecha comunes
-            for date_format in ['%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%m/%d/%Y']:
-                try:
-                    parsed_date = datetime.strptime(t.fecha, date_format).date()
-                    break
-                except ValueError:
-                    continue
-            else:  # Si ningún formato funciona
-                raise ValueError(f"Formato de fecha no reconocido: {t.fecha}")
+            parsed_date, date_format = parse_date(t.fecha, date_format)
         except Exception as e:
             logging.error(f"Error al procesar fecha {t.fecha}: {str(e)}")
             raise HTTPException(
@@ -165,27 +173,13 @@ async def create_bulk_income_transactions(transactions: List[IncomeTransactionIn
             "bank_id": t.banco_id
         })
     
-    # Verificar duplicados y crear nuevas transacciones
+    # Insertar solo las transacciones que no existen (por fecha, descripción y monto)
+    new_ids, duplicates_count = await insert_new_rows(IncomeTransaction, processed_transactions)
     inserted_transactions = []
-    duplicates_count = 0
-    
-    for trans_data in processed_transactions:
-        # Buscar si ya existe una transacción igual por fecha, descripción y monto
-        existing = await IncomeTransaction.filter(
-            transaction_date=trans_data["transaction_date"],
-            description=trans_data["description"],
-            amount=trans_data["amount"]
-        ).first()
-        
-        if existing:
-            duplicates_count += 1
-            logging.info(f"Transacción de ingreso duplicada: {trans_data}")
-            continue
-        
-        # Si no existe, crear nueva transacción
-        transaction_obj = await IncomeTransaction.create(**trans_data)
-        trans_pydantic = await IncomeTransaction_Pydantic.from_tortoise_orm(transaction_obj)
-        inserted_transactions.append(trans_pydantic)
+    if new_ids:
+        inserted_transactions = await IncomeTransaction.filter(id__in=new_ids).order_by("id").values(
+            *INCOME_TRANSACTION_FIELDS
+        )
         
     return {
         "total_recibidas": len(transactions),
@@ -1,38 +1,151 @@
 """Módulo para manejar operaciones relacionadas con transacciones"""
 
+import asyncio
 import logging
+import multiprocessing
 import os
-import sys
+import re
+import shutil
 import tempfile
-import math
 import json
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import List, Dict, Any, Union, Optional
 from datetime import date, datetime
+from decimal import Decimal
 
+import orjson
 import pandas as pd
 import numpy as np
 from database.models import Transaction
 from database.schemas import Transaction_Pydantic, TransactionIn_Pydantic
 from fastapi import APIRouter, File, Form, HTTPException, UploadFile, Body, Query
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-import calendar
+from services.date_parsing import parse_date
+from services.transaction_keys import insert_new_rows
+from services.date_ranges import month_range
+from services.report_cache import file_digest, get_cached_report, store_report
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler(sys.stdout)],
-)
-logger = logging.getLogger("contable")
+# El nivel y formato de los logs se configuran una sola vez en main.py
+logger = logging.getLogger(__name__)
 
 
 router = APIRouter(tags=["Transactions"])
 
+# Tamaño de bloque al copiar archivos subidos a disco
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Columnas de cada movimiento devuelto por los extractores de bancos
+COLUMNAS_MOVIMIENTO = ["Fecha", "Descripción", "Monto", "Tipo"]
+
+# Patrones para reconocer las columnas de las cartolas por su nombre,
+# compilados una vez (sin distinguir mayúsculas)
+SANTANDER_COLUMNAS = {
+    "fecha": re.compile(r"fecha", re.IGNORECASE),
+    "descripcion": re.compile(r"descrip|detalle|glosa|concepto", re.IGNORECASE),
+    "cargo": re.compile(r"cargo|débito|debito", re.IGNORECASE),
+    "abono": re.compile(r"abono|crédito|credito", re.IGNORECASE),
+    "monto": re.compile(r"monto", re.IGNORECASE),
+}
+# Tipo de cada columna de la cartola de Banco Chile en una sola expresión.
+# Las alternativas se prueban en orden desde el inicio del nombre, así que
+# se respeta la prioridad fecha > descripción > cargo > abono > monto
+BANCOCHILE_COLUMNA_RE = re.compile(
+    r"(?=.*fecha)(?P<fecha>)"
+    r"|(?=.*(?:descripci[óo]n|glosa|detalle))(?P<descripcion>)"
+    r"|(?=.*(?:cargo|d[ée]bito))(?P<cargo>)"
+    r"|(?=.*(?:abono|cr[ée]dito))(?P<abono>)"
+    r"|(?=.*monto)(?P<monto>)",
+    re.IGNORECASE | re.DOTALL,
+)
+BCI_COLUMNAS = {
+    "Fecha": re.compile(r"fecha", re.IGNORECASE),
+    "Descripción": re.compile(r"descripción|descripcion|detalle|glosa", re.IGNORECASE),
+    "Cargo": re.compile(r"cargo|débito", re.IGNORECASE),
+    "Abono": re.compile(r"abono|crédito", re.IGNORECASE),
+    "Monto": re.compile(r"monto|valor", re.IGNORECASE),
+}
+
+# Cantidad de filas iniciales en las que se buscan los encabezados de la
+# tabla de movimientos: primero un tramo corto y, si no aparecen, uno mayor
+TRAMOS_BUSQUEDA_ENCABEZADO = (50, 200)
+
+# Motor para leer Excel: calamine (Rust) es bastante más rápido que
+# openpyxl/xlrd y lee tanto .xls como .xlsx; si no está instalado se deja
+# que pandas elija el motor según la extensión
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = None
+
+# Tipo de las columnas de texto en las búsquedas de subtotales: con pyarrow
+# str.contains se ejecuta en C++ sobre el arreglo completo; sin él se usa
+# el tipo string de pandas
+try:
+    import pyarrow  # noqa: F401
+    TEXTO_DTYPE = "string[pyarrow]"
+except ImportError:
+    TEXTO_DTYPE = "string"
+
+
+# Columnas de una transacción que se devuelven en el listado completo
+TRANSACTION_FIELDS = (
+    "id", "transaction_date", "description", "amount", "category",
+    "bank_id", "created_at", "updated_at"
+)
+
+# Filas por consulta al emitir el listado completo de transacciones
+TRANSACTION_STREAM_BATCH_SIZE = 1000
+
+
+def decimal_default(obj: Any) -> Any:
+    """
+    Serializa para orjson los montos Decimal como lo hace FastAPI.
+
+    El campo amount redondea el valor de la columna (mitad al par) al leerlo;
+    igual que el codificador de FastAPI, un Decimal sin decimales se devuelve
+    como entero y uno con decimales como float.
+    """
+    if isinstance(obj, Decimal):
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    raise TypeError(f"Tipo no serializable en JSON: {type(obj).__name__}")
+
+
+async def stream_transactions():
+    """
+    Emite todas las transacciones como un arreglo JSON, lote a lote.
+
+    Cada lote se lee por rango de ID (sin OFFSET) con solo las columnas de la
+    respuesta y se serializa con orjson, así la memoria usada no depende del
+    tamaño de la tabla ni se construye un modelo Pydantic por fila. El monto
+    se lee con el campo del modelo y se serializa con decimal_default, así
+    conserva el redondeo y el tipo JSON de la respuesta con response_model.
+    """
+    yield b"["
+    separator = b""
+    last_id = 0
+    while True:
+        rows = await Transaction.filter(id__gt=last_id).order_by("id").limit(
+            TRANSACTION_STREAM_BATCH_SIZE
+        ).values(*TRANSACTION_FIELDS)
+        if not rows:
+            break
+        # Se quitan los corchetes del arreglo del lote para unirlo a los anteriores
+        yield separator + orjson.dumps(rows, default=decimal_default)[1:-1]
+        separator = b","
+        last_id = rows[-1]["id"]
+        if len(rows) < TRANSACTION_STREAM_BATCH_SIZE:
+            break
+    yield b"]"
+
 
 @router.get("/transactions", response_model=List[Transaction_Pydantic])
 async def get_all_transactions():
     """Obtiene todas las transacciones de la base de datos"""
-    return await Transaction_Pydantic.from_queryset(Transaction.all())
+    return StreamingResponse(stream_transactions(), media_type="application/json")
 
 
 @router.get("/transactions/{transaction_id}", response_model=Transaction_Pydantic)
@@ -51,33 +164,34 @@ async def create_transaction(transaction: TransactionIn_Pydantic):
     return await Transaction_Pydantic.from_tortoise_orm(transaction_obj)
 
 
-def sanitize_json_data(obj: Any) -> Any:
+def json_default(obj: Any) -> Any:
     """
-    Convierte valores no serializables en JSON (como NaN, Infinity) a valores compatibles.
-    También convierte numpy.int64/float64 a tipos Python nativos para serialización.
+    Serializa para orjson los valores de pandas que no maneja directamente.
+
+    orjson ya convierte en C los tipos nativos y los escalares de NumPy
+    (NaN e Infinity quedan como null); este callback solo se invoca para el
+    resto: fechas (incluido pd.Timestamp) y valores faltantes de pandas.
     """
-    if isinstance(obj, dict):
-        return {k: sanitize_json_data(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [sanitize_json_data(item) for item in obj]
-    elif isinstance(obj, (np.integer, np.int64)):
-        return int(obj)
-    elif isinstance(obj, (np.floating, np.float64)):
-        num = float(obj)
-        if math.isnan(num):
-            return None
-        elif math.isinf(num):
-            return None  # o podrías usar str(num) para mantener "inf"/"-inf" como cadena
-        else:
-            return num
-    elif isinstance(obj, (pd.Timestamp, pd._libs.tslibs.timestamps.Timestamp)):
-        return obj.isoformat()
-    elif pd.isna(obj):
+    if isinstance(obj, (datetime, date)):
+        # NaT también es un datetime: una fecha faltante se devuelve como null
+        return None if obj is pd.NaT else obj.isoformat()
+    if pd.api.types.is_scalar(obj) and pd.isna(obj):
         return None
-    else:
-        return obj
+    raise TypeError(f"Tipo no serializable en JSON: {type(obj).__name__}")
+
+
+class BankReportResponse(ORJSONResponse):
+    """Respuesta JSON de /upload-bank-report, serializada directamente desde pandas/NumPy"""
 
-@router.post("/upload-bank-report")
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=json_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+
+
+@router.post("/upload-bank-report", response_class=BankReportResponse)
 async def upload_bank_report(
     file: UploadFile = File(...),
     bank_id: str = Form(...),
@@ -96,38 +210,51 @@ async def upload_bank_report(
             status_code=400, detail="El archivo debe ser un Excel (.xls o .xlsx)"
         )
 
-    # Guardar el archivo temporalmente
-    temp_file = tempfile.NamedTemporaryFile(
-        delete=False, suffix=os.path.splitext(file.filename)[1]
-    )
+    # Validar el banco antes de tocar el archivo
+    parser = BANK_PARSERS.get(bank_id)
+    if parser is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"ID de banco no válido: {bank_id}. Valores permitidos: {VALID_BANK_IDS_TEXT}"
+        )
+
+    temp_file = None
     try:
-        contents = await file.read()
-        with open(temp_file.name, "wb") as f:
-            f.write(contents)
-
-        # Procesar el archivo según el ID del banco
-        if bank_id == 'bancoestado':  # BancoEstado
-            saldo, movimientos = extraer_datos_bancoestado(temp_file.name)
-        elif bank_id == 'bancochile':  # BancoChile
-            saldo, movimientos = extraer_datos_bancochile(temp_file.name)
-        elif bank_id == 'bancosantander':  # Santander
-            saldo, movimientos = extraer_datos_santander(temp_file.name)
-        elif bank_id == 'bancobci':  # BCI
-            saldo, movimientos = extraer_datos_bci(temp_file.name)
-        else:
-            raise HTTPException(
-                status_code=400, detail=f"ID de banco no válido: {bank_id}"
-            )
+        # El archivo se guarda temporalmente (al pool de procesos se le pasa la
+        # ruta, no el contenido), copiándolo por bloques en un hilo aparte en
+        # lugar de cargarlo completo en memoria
+        temp_file = tempfile.NamedTemporaryFile(
+            delete=False, suffix=os.path.splitext(file.filename)[1]
+        )
+        await run_in_threadpool(shutil.copyfileobj, file.file, temp_file, UPLOAD_CHUNK_SIZE)
+        temp_file.close()
+        origen = temp_file.name
+
+        # Si el mismo archivo ya se procesó para este banco con la versión
+        # actual de los extractores, se devuelve la respuesta guardada sin
+        # volver a leer el Excel
+        digest = await run_in_threadpool(file_digest, origen)
+        cached = await run_in_threadpool(get_cached_report, bank_id, REPORT_PARSER_VERSION, digest)
+        if cached is not None:
+            return Response(content=cached, media_type="application/json")
         
-        # Sanitizar datos para evitar errores de serialización JSON
-        response_data = {
+        # Procesar el archivo según el ID del banco. La lectura del Excel es
+        # síncrona y costosa, así que se ejecuta en otro proceso para no
+        # bloquear el event loop ni retener el GIL
+        saldo, movimientos = await procesar_reporte_en_pool(parser, origen)
+        
+        # Los valores de pandas/NumPy (NaN, Timestamp, int64...) se convierten
+        # al serializar, sin recorrer antes la respuesta en Python
+        response = BankReportResponse({
             "bank_id": bank_id,
             "balance": saldo,
             "transactions": movimientos
-        }
-        
-        sanitized_data = sanitize_json_data(response_data)
-        return sanitized_data
+        })
+        if movimientos:
+            await run_in_threadpool(
+                store_report, bank_id, REPORT_PARSER_VERSION, digest, response.body
+            )
+        return response
         
     except Exception as e:
         logger.error(f"Error al procesar el archivo: {str(e)}", exc_info=True)
@@ -136,186 +263,325 @@ async def upload_bank_report(
         )
     finally:
         # Limpiar archivos temporales
-        temp_file.close()
-        os.unlink(temp_file.name)
+        if temp_file is not None:
+            temp_file.close()
+            os.unlink(temp_file.name)
+
+
+def texto_celdas(df):
+    """
+    Convierte el DataFrame en una matriz NumPy de texto en minúsculas.
+
+    Las celdas vacías quedan como "" para que las búsquedas de encabezados y
+    saldos se hagan de forma vectorizada sobre toda la hoja, sin recorrer
+    fila por fila.
+    """
+    valores = df.to_numpy(dtype=object)
+    return np.char.lower(np.where(pd.isna(valores), "", valores).astype(str))
+
+
+def filas_con_terminos(texto, terminos):
+    """Devuelve, por fila, cuántos de los términos aparecen en alguna de sus celdas"""
+    conteo = np.zeros(texto.shape[0], dtype=int)
+    for termino in terminos:
+        conteo += (np.char.find(texto, termino) >= 0).any(axis=1)
+    return conteo
+
+
+def buscar_filas_encabezado(df, condicion):
+    """
+    Busca filas de encabezado solo entre las primeras filas de la hoja.
+
+    Los encabezados de las cartolas están al comienzo, así que no se recorre
+    la hoja completa: se revisan los tramos de TRAMOS_BUSQUEDA_ENCABEZADO en
+    orden y se detiene en el primero que tenga alguna coincidencia.
+
+    Args:
+        df: Hoja leída del Excel
+        condicion: Función que recibe la matriz de texto del tramo (ver
+            texto_celdas) y devuelve una máscara booleana por fila
+
+    Returns:
+        tuple: (índices de las filas que cumplen la condición, matriz de texto del tramo)
+    """
+    for limite in TRAMOS_BUSQUEDA_ENCABEZADO:
+        texto = texto_celdas(df.iloc[:limite])
+        filas = np.flatnonzero(condicion(texto))
+        if filas.size or limite >= len(df):
+            break
+    return filas, texto
+
+
+def filas_con_fecha(columna, validar_texto=False):
+    """
+    Devuelve las posiciones de las celdas de una columna que parecen fechas.
+
+    Se evalúa la columna completa de una vez: son fechas las celdas de tipo
+    fecha y los textos de al menos 8 caracteres con dígitos y separadores
+    (DD/MM/YYYY o similares). Con validar_texto=True esos textos además
+    deben poder interpretarse como fecha con el día primero, cada celda por
+    separado.
+
+    Returns:
+        numpy.ndarray: Posiciones (0..n-1) de las celdas con fecha, en orden
+    """
+    columna = pd.Series(columna.to_numpy(dtype=object))
+    es_fecha = columna.map(lambda x: isinstance(x, (pd.Timestamp, datetime, date))).astype(bool)
+    textos = columna[columna.map(lambda x: isinstance(x, str)).astype(bool)].astype(str)
+    textos = textos[
+        (textos.str.len() >= 8)
+        & textos.str.contains(r"[/.\-]")
+        & textos.str.contains(r"\d")
+    ]
+    if validar_texto and not textos.empty:
+        fechas = pd.to_datetime(textos, errors="coerce", dayfirst=True, format="mixed")
+        textos = textos[fechas.notna()]
+    es_fecha.loc[textos.index] = True
+    return np.flatnonzero(es_fecha.to_numpy())
+
+
+def mapear_columnas(columnas, patrones):
+    """
+    Busca, para cada columna destino, la primera columna cuyo nombre coincide con su patrón.
+
+    Args:
+        columnas: Nombres de columnas del DataFrame
+        patrones: Diccionario columna destino -> expresión regular compilada
+
+    Returns:
+        dict: Columna destino -> nombre de la columna encontrada (solo las encontradas)
+    """
+    columnas = pd.Index(columnas)
+    nombres = columnas.astype(str)
+    encontradas = {}
+    for destino, patron in patrones.items():
+        coincide = nombres.str.contains(patron, regex=True)
+        if coincide.any():
+            encontradas[destino] = columnas[coincide.argmax()]
+    return encontradas
+
+
+def convertir_montos(serie):
+    """
+    Convierte una columna de montos a números de forma vectorizada.
+
+    Los valores que ya son numéricos se mantienen. Los textos con formato de
+    moneda chilena ("$ 1.234,56") se limpian de una vez con las operaciones
+    .str de pandas: se quitan símbolos y separadores de miles y la coma pasa
+    a ser el separador decimal. Lo que no se puede interpretar queda en 0.
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        # Columna ya numérica (el caso de las hojas leídas con encabezado): no
+        # hay textos que limpiar
+        return serie.fillna(0)
+    es_texto = serie.map(lambda x: isinstance(x, str)).astype(bool)
+    montos = pd.to_numeric(serie.where(~es_texto), errors="coerce")
+    if es_texto.any():
+        textos = (
+            serie[es_texto]
+            .str.replace(r"[^\d,.\-]", "", regex=True)
+            .str.replace(".", "", regex=False)
+            .str.replace(",", ".", regex=False)
+        )
+        montos.loc[es_texto] = pd.to_numeric(textos, errors="coerce")
+    return montos.fillna(0)
+
+
+def cargos(montos):
+    """Valor absoluto de los montos negativos (cargos); 0 para el resto, incluidos los NaN"""
+    return (-montos).clip(lower=0).fillna(0)
+
+
+def abonos(montos):
+    """Montos positivos (abonos); 0 para el resto, incluidos los NaN"""
+    return montos.clip(lower=0).fillna(0)
+
+
+def registros(df, columnas=None):
+    """
+    Convierte el DataFrame en una lista de diccionarios (uno por fila).
+
+    Equivale a to_dict(orient="records") pero recorre las filas con
+    itertuples, sin armar un diccionario intermedio por columna.
+    """
+    columnas = list(df.columns) if columnas is None else columnas
+    datos = df[columnas]
+    # Las columnas datetime64 se formatean de una vez (mismo texto que
+    # isoformat), en vez de convertir cada fecha al serializar la respuesta
+    fechas = [col for col in columnas if pd.api.types.is_datetime64_any_dtype(datos[col])]
+    if fechas:
+        datos = datos.assign(**{col: datos[col].dt.strftime("%Y-%m-%dT%H:%M:%S") for col in fechas})
+    return [dict(zip(columnas, fila)) for fila in datos.itertuples(index=False, name=None)]
+
+
+def contiene_texto(serie, patron, case=True):
+    """
+    Máscara de las celdas cuyo texto coincide con el patrón.
+
+    Las celdas vacías nunca coinciden (igual que el texto "nan" de
+    astype(str)), así que la máscara se puede negar directamente.
+    """
+    return serie.astype(TEXTO_DTYPE).str.contains(patron, case=case, regex=True, na=False).to_numpy(dtype=bool)
+
+
+def fechas_a_datetime(serie):
+    """
+    Convierte a datetime64 una columna de fechas que quedó con dtype object.
+
+    Al leer sin encabezado pandas no infiere el tipo de la columna, aunque
+    todas sus celdas sean fechas. Solo se convierte si todas las celdas no
+    vacías ya son fechas: el texto no se reinterpreta con otro formato.
+    """
+    if pd.api.types.infer_dtype(serie, skipna=True) in ("datetime", "datetime64"):
+        return pd.to_datetime(serie)
+    return serie
 
 
 def extraer_datos_bancoestado(archivo):
     """Extrae el saldo contable y movimientos de un archivo de BancoEstado."""
-    # Cargar el archivo Excel
-    xls = pd.ExcelFile(archivo)
-    sheet_name = xls.sheet_names[0]  # Asume que la primera hoja es la correcta
-    df = pd.read_excel(xls, sheet_name=sheet_name)
+    # Cargar solo las 4 columnas usadas de la primera hoja (se asume que es
+    # la correcta): Fecha, N° Operación, Descripción, Cargo/Abono.
+    # Sin encabezado, así que las filas quedan desplazadas en uno respecto
+    # de la hoja leída con encabezado
+    df = pd.read_excel(
+        archivo, sheet_name=0, header=None, usecols=[0, 1, 2, 3], engine=EXCEL_ENGINE
+    )
     # Extraer saldo contable
-    saldo_contable = df.iloc[9, 3]
-    
-    # Extraer movimientos (a partir de la fila 13 en adelante)
-    df_movimientos = df.iloc[
-        13:, [0, 1, 2, 3]
-    ]  # Fecha, N° Operación, Descripción, Cargo/Abono
-    
-    df_movimientos.columns = ["Fecha", "N° Operación", "Descripción", "Monto"]
+    saldo_contable = df.iat[10, 3]
     
-    # Filtrar filas que corresponden a subtotales o totales
-    df_movimientos = df_movimientos[
-        ~df_movimientos["Descripción"].astype(str).str.contains("Subtotal|SUBTOTAL|Total|TOTAL", na=False)
-    ]
-    
-    # Filtrar filas donde la fecha no es nula (elimina filas de subtotal adicionales)
-    df_movimientos = df_movimientos[df_movimientos["Fecha"].notna()]
+    # Extraer movimientos (a partir de la fila 14 en adelante)
+    df_movimientos = df.iloc[14:].set_axis(["Fecha", "N° Operación", "Descripción", "Monto"], axis=1)
     
-    # Convertir montos a numéricos
-    df_movimientos["Monto"] = pd.to_numeric(df_movimientos["Monto"], errors="coerce")
-    
-    # Identificar ingresos y gastos
-    df_movimientos["Tipo"] = df_movimientos["Monto"].apply(
-        lambda x: "Ingreso" if x > 0 else "Gasto" if x < 0 else None
+    # Convertir montos a numéricos una sola vez; los filtros y el tipo se
+    # calculan sobre esta misma serie
+    montos = pd.to_numeric(df_movimientos["Monto"], errors="coerce")
+    absolutos = montos.abs()
+
+    # Todos los filtros en una sola máscara, sin un DataFrame intermedio por
+    # cada uno:
+    # - filas que no corresponden a subtotales o totales
+    # - fecha no nula (elimina filas de subtotal adicionales)
+    # - montos válidos: la comparación sobre el valor absoluto descarta cero
+    #   y NaN (NaN > 0 es falso)
+    validos = (
+        ~contiene_texto(df_movimientos["Descripción"], "Subtotal|SUBTOTAL|Total|TOTAL")
+        & df_movimientos["Fecha"].notna().to_numpy()
+        & (absolutos > 0).to_numpy()
+    )
+
+    # Identificar ingresos y gastos y tomar el valor absoluto de los montos
+    df_movimientos = df_movimientos.loc[validos].assign(
+        Fecha=lambda d: fechas_a_datetime(d["Fecha"]),
+        Monto=absolutos[validos],
+        Tipo=np.where(montos[validos] > 0, "Ingreso", "Gasto"),
     )
-    
-    # Filtrar registros con montos válidos y tipos identificados
-    df_movimientos = df_movimientos[df_movimientos["Tipo"].notna()]
-    
-    # Tomar el valor absoluto de los montos
-    df_movimientos["Monto"] = df_movimientos["Monto"].abs()
     
     # Convertir DataFrame a lista de diccionarios
-    movimientos_bancoestado = df_movimientos.to_dict(orient="records")
+    movimientos_bancoestado = registros(df_movimientos)
     return saldo_contable, movimientos_bancoestado
 
 
 def extraer_datos_bancochile(archivo):
     """Extrae el saldo contable y movimientos de un archivo de Banco de Chile."""
-    try:
-        logger.info("Iniciando procesamiento de archivo Banco Chile: %s", archivo)
-        # Intentar múltiples estrategias para cargar y procesar el archivo
-        
-        # 1. Intento directo con pandas - formato estándar
+    logger.info("Iniciando procesamiento de archivo Banco Chile: %s", archivo)
+    # Intentar múltiples estrategias para cargar y procesar el archivo.
+    # El libro se abre una sola vez y todas las lecturas reutilizan el
+    # mismo ExcelFile
+
+    xls = pd.ExcelFile(archivo, engine=EXCEL_ENGINE)
+
+    # 1. Probar con cada hoja del archivo, empezando por la primera
+    # (formato estándar)
+    for sheet_name in xls.sheet_names:
         try:
-            # Cargar el archivo Excel - probar primero sheet_name=0
-            df = pd.read_excel(archivo, sheet_name=0)
-            logger.info(f"Archivo cargado exitosamente con dimensiones: {df.shape}")
-            
+            logger.info(f"Intentando con hoja: {sheet_name}")
+            df = pd.read_excel(xls, sheet_name=sheet_name)
+            logger.info(f"Hoja cargada exitosamente con dimensiones: {df.shape}")
+
             # Estrategia 1: Formato específico para Banco de Chile
             # Este es un enfoque directo para extraer datos si conocemos la estructura exacta
             saldo, movimientos = extraer_datos_bancochile_formato1(df)
             if movimientos and len(movimientos) > 0:
-                logger.info(f"Datos extraídos con formato 1: {len(movimientos)} movimientos")
+                logger.info(f"Datos extraídos de hoja {sheet_name} con formato 1: {len(movimientos)} movimientos")
                 return saldo, movimientos
-            
+
             # Estrategia 2: Búsqueda flexible de patrones
             saldo, movimientos = extraer_datos_bancochile_formato2(df)
             if movimientos and len(movimientos) > 0:
-                logger.info(f"Datos extraídos con formato 2: {len(movimientos)} movimientos")
+                logger.info(f"Datos extraídos de hoja {sheet_name} con formato 2: {len(movimientos)} movimientos")
                 return saldo, movimientos
-            
+
             # Estrategia 3: Análisis estructural completo
             logger.info("Usando análisis estructural para detectar movimientos")
             saldo, movimientos = extraer_datos_bancochile_analisis_estructural(df)
             if movimientos and len(movimientos) > 0:
-                logger.info(f"Datos extraídos con análisis estructural: {len(movimientos)} movimientos")
-                return saldo, movimientos
-            
-        except Exception as e:
-            logger.warning(f"Error en primer intento: {str(e)}. Intentando con otras hojas...")
-        
-        # 2. Probar con todas las hojas del archivo
-        xls = pd.ExcelFile(archivo)
-        for sheet_name in xls.sheet_names:
-            try:
-                logger.info(f"Intentando con hoja: {sheet_name}")
-                df = pd.read_excel(xls, sheet_name=sheet_name)
-                
-                # Intentar los mismos métodos con cada hoja
-                saldo, movimientos = extraer_datos_bancochile_formato1(df)
-                if movimientos and len(movimientos) > 0:
-                    logger.info(f"Datos extraídos de hoja {sheet_name} con formato 1: {len(movimientos)} movimientos")
-                    return saldo, movimientos
-                
-                saldo, movimientos = extraer_datos_bancochile_formato2(df)
-                if movimientos and len(movimientos) > 0:
-                    logger.info(f"Datos extraídos de hoja {sheet_name} con formato 2: {len(movimientos)} movimientos")
-                    return saldo, movimientos
-                
-                saldo, movimientos = extraer_datos_bancochile_analisis_estructural(df)
-                if movimientos and len(movimientos) > 0:
-                    logger.info(f"Datos extraídos de hoja {sheet_name} con análisis estructural: {len(movimientos)} movimientos")
-                    return saldo, movimientos
-                
-            except Exception as e:
-                logger.warning(f"Error procesando hoja {sheet_name}: {str(e)}")
-        
-        # 3. Último intento - cargar sin encabezados
-        try:
-            logger.info("Intentando cargar sin encabezados")
-            df = pd.read_excel(archivo, header=None)
-            saldo, movimientos = extraer_datos_bancochile_sin_encabezados(df)
-            if movimientos and len(movimientos) > 0:
-                logger.info(f"Datos extraídos sin encabezados: {len(movimientos)} movimientos")
+                logger.info(f"Datos extraídos de hoja {sheet_name} con análisis estructural: {len(movimientos)} movimientos")
                 return saldo, movimientos
+
         except Exception as e:
-            logger.warning(f"Error en intento sin encabezados: {str(e)}")
-        
-        # Si llegamos aquí, no se pudieron extraer datos
-        logger.error("No se pudieron extraer movimientos del archivo de Banco Chile")
-        return 0, []
-            
+            logger.warning(f"Error procesando hoja {sheet_name}: {str(e)}")
+
+    # 2. Último intento - cargar la primera hoja sin encabezados
+    try:
+        logger.info("Intentando cargar sin encabezados")
+        df = pd.read_excel(xls, sheet_name=0, header=None)
+        saldo, movimientos = extraer_datos_bancochile_sin_encabezados(df)
+        if movimientos and len(movimientos) > 0:
+            logger.info(f"Datos extraídos sin encabezados: {len(movimientos)} movimientos")
+            return saldo, movimientos
     except Exception as e:
-        logger.error(f"Error general al procesar archivo de Banco Chile: {str(e)}", exc_info=True)
-        return 0, []
+        logger.warning(f"Error en intento sin encabezados: {str(e)}")
+    
+    # Si llegamos aquí, no se pudieron extraer datos
+    logger.error("No se pudieron extraer movimientos del archivo de Banco Chile")
+    return 0, []
 
 def extraer_datos_bancochile_formato1(df):
     """Extrae datos de archivo BancoChile con formato estándar"""
     saldo_disponible = 0
-    
+
     # Buscar saldo directamente - formato común
     try:
-        # Buscar celdas que contengan "Saldo"
-        for i in range(min(20, len(df))):
-            row_str = ' '.join([str(x).lower() for x in df.iloc[i].values if not pd.isna(x)])
-            if 'saldo' in row_str:
-                # Buscar valor numérico en la misma fila
-                numeric_values = [x for x in df.iloc[i].values if isinstance(x, (int, float)) and not pd.isna(x)]
-                if numeric_values:
-                    saldo_disponible = float(numeric_values[0])
-                    logger.info(f"Saldo encontrado: {saldo_disponible}")
-                    break
+        # Buscar celdas que contengan "Saldo" en las primeras filas
+        for i in np.flatnonzero(filas_con_terminos(texto_celdas(df.iloc[:20]), ['saldo'])):
+            # Buscar valor numérico en la misma fila
+            numeric_values = [x for x in df.iloc[i].values if isinstance(x, (int, float)) and not pd.isna(x)]
+            if numeric_values:
+                saldo_disponible = float(numeric_values[0])
+                logger.info(f"Saldo encontrado: {saldo_disponible}")
+                break
     except Exception as e:
         logger.warning(f"Error al buscar saldo: {str(e)}")
-    
+
     # Buscar tabla de movimientos por encabezados específicos
     try:
-        # Buscar fila con encabezados típicos de Banco Chile
+        # Buscar la primera fila con al menos 2 encabezados típicos de Banco Chile
         encabezados_buscar = ['fecha', 'descripción', 'cargo', 'abono', 'monto']
         header_row = None
-        
-        for i in range(len(df)):
-            # Convertir fila a texto y buscar encabezados
-            row_values = [str(x).lower() for x in df.iloc[i].values if not pd.isna(x)]
-            row_str = ' '.join(row_values)
-            
-            # Verificar cuántos encabezados están presentes
-            present_headers = sum(1 for h in encabezados_buscar if any(h in s for s in row_values))
-            
-            if present_headers >= 2:  # Si hay al menos 2 encabezados
-                header_row = i
-                logger.info(f"Encabezados encontrados en fila {i}: {row_str}")
-                break
-        
+
+        candidatas, texto = buscar_filas_encabezado(
+            df, lambda texto: filas_con_terminos(texto, encabezados_buscar) >= 2
+        )
+        if candidatas.size:
+            header_row = int(candidatas[0])
+            row_str = ' '.join(x for x in texto[header_row] if x)
+            logger.info(f"Encabezados encontrados en fila {header_row}: {row_str}")
+
         if header_row is not None:
             # Verificar que hay suficientes filas para procesar después del encabezado
             if header_row + 1 < len(df):
                 # Extraer datos desde la fila siguiente a los encabezados
-                data_df = df.iloc[header_row+1:].copy()
+                data_df = df.iloc[header_row+1:]
                 
                 # Asegurar que las columnas sean válidas antes de asignar
-                valid_columns = []
-                if len(df.iloc[header_row]) == len(data_df.columns):
+                encabezados = df.iloc[header_row].tolist()
+                if len(encabezados) == len(data_df.columns):
                     # Asignar nombres de columnas desde la fila de encabezado
-                    data_df.columns = df.iloc[header_row]
+                    data_df = data_df.set_axis(encabezados, axis=1)
                 else:
                     # Si hay un problema con las dimensiones, usar nombres genéricos
                     logger.warning(f"Incompatibilidad en número de columnas. Usando nombres genéricos.")
-                    data_df.columns = [f"Column{i}" for i in range(len(data_df.columns))]
+                    data_df = data_df.set_axis([f"Column{i}" for i in range(len(data_df.columns))], axis=1)
                 
                 # Identificar columnas relevantes
                 cols = {
@@ -326,19 +592,12 @@ def extraer_datos_bancochile_formato1(df):
                     'monto': None
                 }
                 
-                # Mapear columnas detectadas
+                # Mapear columnas detectadas: una sola búsqueda por nombre de
+                # columna, el grupo que coincide indica su tipo
                 for col in data_df.columns:
-                    col_str = str(col).lower()
-                    if 'fecha' in col_str:
-                        cols['fecha'] = col
-                    elif any(x in col_str for x in ['descripción', 'descripcion', 'glosa', 'detalle']):
-                        cols['descripcion'] = col
-                    elif any(x in col_str for x in ['cargo', 'débito', 'debito']):
-                        cols['cargo'] = col
-                    elif any(x in col_str for x in ['abono', 'crédito', 'credito']):
-                        cols['abono'] = col
-                    elif 'monto' in col_str:
-                        cols['monto'] = col
+                    coincidencia = BANCOCHILE_COLUMNA_RE.match(str(col))
+                    if coincidencia:
+                        cols[coincidencia.lastgroup] = col
                 
                 # Si no se encontró columna de fecha, usar la primera columna
                 if cols['fecha'] is None and len(data_df.columns) > 0:
@@ -362,30 +621,17 @@ def extraer_datos_bancochile_formato1(df):
                         result_df['Cargo'] = 0
                         result_df['Abono'] = 0
                         
-                        # Función para limpiar y convertir montos
-                        def parse_monto(valor):
-                            if pd.isna(valor):
-                                return 0
-                            if isinstance(valor, (int, float)):
-                                return float(valor)
-                            # Limpiar strings
-                            valor_str = str(valor).replace('$', '').replace('.', '').replace(',', '.').strip()
-                            try:
-                                return float(valor_str)
-                            except:
-                                return 0
-                        
                         # Procesar cargos y abonos si existen
                         if cols['cargo'] and cols['cargo'] in data_df.columns:
-                            result_df['Cargo'] = data_df[cols['cargo']].apply(parse_monto)
+                            result_df['Cargo'] = convertir_montos(data_df[cols['cargo']])
                         if cols['abono'] and cols['abono'] in data_df.columns:
-                            result_df['Abono'] = data_df[cols['abono']].apply(parse_monto)
+                            result_df['Abono'] = convertir_montos(data_df[cols['abono']])
                         
                         # Si hay una columna de monto único
                         if cols['monto'] and cols['monto'] in data_df.columns and not (cols['cargo'] or cols['abono']):
-                            montos = data_df[cols['monto']].apply(parse_monto)
-                            result_df['Cargo'] = montos.apply(lambda x: abs(x) if x < 0 else 0)
-                            result_df['Abono'] = montos.apply(lambda x: x if x > 0 else 0)
+                            montos = convertir_montos(data_df[cols['monto']])
+                            result_df['Cargo'] = cargos(montos)
+                            result_df['Abono'] = abonos(montos)
                         
                         # Determinar tipo - Corregir la lógica
                         # Siempre asignar según valores en Cargo y Abono
@@ -400,20 +646,20 @@ def extraer_datos_bancochile_formato1(df):
                         result_df.loc[ingresos_mask, 'Tipo'] = 'Ingreso'
                         
                         # Calcular monto final basado en el tipo
-                        result_df['Monto'] = result_df.apply(
-                            lambda row: row['Abono'] if row['Tipo'] == 'Ingreso' else row['Cargo'], 
-                            axis=1
+                        result_df['Monto'] = np.where(
+                            result_df['Tipo'] == 'Ingreso', result_df['Abono'], result_df['Cargo']
                         )
                         
-                        # Limpiar datos
-                        result_df = result_df.dropna(subset=['Fecha'])
-                        result_df = result_df[result_df['Monto'] != 0]
-                        
-                        # Filtrar filas de totales y subtotales
-                        result_df = result_df[~result_df['Descripción'].astype(str).str.contains('total|subtotal|saldo', case=False)]
+                        # Limpiar datos y filtrar filas de totales y subtotales con una sola
+                        # máscara, en vez de un DataFrame intermedio por cada filtro
+                        result_df = result_df.loc[
+                            result_df['Fecha'].notna().to_numpy()
+                            & (result_df['Monto'] != 0).to_numpy()
+                            & ~contiene_texto(result_df['Descripción'], 'total|subtotal|saldo', case=False)
+                        ]
                         
                         # Convertir a lista de diccionarios
-                        movimientos = result_df[['Fecha', 'Descripción', 'Monto', 'Tipo']].to_dict(orient='records')
+                        movimientos = registros(result_df, COLUMNAS_MOVIMIENTO)
                         
                         if movimientos and len(movimientos) > 0:
                             return saldo_disponible, movimientos
@@ -432,27 +678,15 @@ def extraer_datos_bancochile_formato2(df):
         fecha_columna = None
         fecha_indices = []
         
-        # Buscar columna con mayor número de fechas
+        # Buscar columna con mayor número de fechas, evaluando cada columna
+        # completa en lugar de celda por celda
         for col_idx in range(df.shape[1]):
-            fecha_count = 0
-            for row_idx in range(df.shape[0]):
-                cell = df.iloc[row_idx, col_idx]
-                # Verificar si es fecha por tipo o por formato
-                if isinstance(cell, (pd.Timestamp, datetime, date)):
-                    fecha_count += 1
-                    fecha_indices.append(row_idx)
-                elif isinstance(cell, str) and len(cell) >= 8:
-                    # Verificar patrones de fecha como DD/MM/YYYY o similares
-                    if any(x in cell for x in ['/', '-', '.']) and any(char.isdigit() for char in cell):
-                        try:
-                            # Intentar convertir a fecha con formato explícito para Chile (DD/MM/YYYY)
-                            pd.to_datetime(cell, errors='raise', dayfirst=True)
-                            fecha_count += 1
-                            fecha_indices.append(row_idx)
-                        except:
-                            pass
-            
-            if fecha_count > 5:  # Si hay suficientes fechas
+            # Verificar si es fecha por tipo o por formato; los textos con
+            # formato de fecha deben poder interpretarse como fecha chilena
+            filas_fecha = filas_con_fecha(df.iloc[:, col_idx], validar_texto=True)
+            fecha_indices.extend(filas_fecha.tolist())
+
+            if len(filas_fecha) > 5:  # Si hay suficientes fechas
                 fecha_columna = col_idx
                 break
         
@@ -464,20 +698,21 @@ def extraer_datos_bancochile_formato2(df):
             header_row = max(0, inicio_tabla - 1)
             
             # Extraer la tabla y convertir a DataFrame
-            data_df = df.iloc[inicio_tabla:].copy()
+            data_df = df.iloc[inicio_tabla:]
             
             # Usar encabezados de la fila anterior o generar automáticamente
             if header_row >= 0:
                 # Verificar si la fila tiene valores no nulos (posibles encabezados)
-                header_values = [str(x) for x in df.iloc[header_row] if not pd.isna(x)]
+                encabezados = df.iloc[header_row].tolist()
+                header_values = [str(x) for x in encabezados if not pd.isna(x)]
                 if len(header_values) >= 2:  # Al menos 2 encabezados
-                    data_df.columns = df.iloc[header_row]
+                    data_df = data_df.set_axis(encabezados, axis=1)
                 else:
                     # Generar encabezados genéricos
-                    data_df.columns = [f"Col{i}" for i in range(data_df.shape[1])]
+                    data_df = data_df.set_axis([f"Col{i}" for i in range(data_df.shape[1])], axis=1)
             else:
                 # Generar encabezados genéricos
-                data_df.columns = [f"Col{i}" for i in range(data_df.shape[1])]
+                data_df = data_df.set_axis([f"Col{i}" for i in range(data_df.shape[1])], axis=1)
             
             # Identificar columnas por posición si no hay encabezados claros
             col_fecha = data_df.columns[fecha_columna]
@@ -502,13 +737,17 @@ def extraer_datos_bancochile_formato2(df):
                     col_descripcion = data_df.columns[0]
             
             # Buscar columnas numéricas para montos
+            # (la conversión de cada columna se guarda para no repetirla al
+            # calcular los montos)
             cols_numericas = []
+            valores_numericos = {}
             for i in range(data_df.shape[1]):
                 if i not in [fecha_columna, data_df.columns.get_loc(col_descripcion)]:
                     # Verificar si la columna tiene valores numéricos
                     numeric_values = pd.to_numeric(data_df.iloc[:, i], errors='coerce')
                     if numeric_values.notna().sum() > len(data_df) * 0.3:  # Al menos 30% son números
                         cols_numericas.append(data_df.columns[i])
+                        valores_numericos[data_df.columns[i]] = numeric_values.fillna(0)
             
             # Crear DataFrame normalizado
             result_df = pd.DataFrame()
@@ -519,41 +758,28 @@ def extraer_datos_bancochile_formato2(df):
             result_df['Cargo'] = 0
             result_df['Abono'] = 0
             
-            # Función para limpiar y convertir montos
-            def parse_monto(valor):
-                if pd.isna(valor):
-                    return 0
-                if isinstance(valor, (int, float)):
-                    return float(valor)
-                # Limpiar strings
-                valor_str = str(valor).replace('$', '').replace('.', '').replace(',', '.').strip()
-                try:
-                    return float(valor_str)
-                except:
-                    return 0
-            
             # Procesar columnas numéricas
             if len(cols_numericas) == 1:
                 # Una sola columna de monto (probablemente con signos)
-                montos = pd.to_numeric(data_df[cols_numericas[0]], errors='coerce').fillna(0)
-                result_df['Cargo'] = montos.apply(lambda x: abs(x) if x < 0 else 0)
-                result_df['Abono'] = montos.apply(lambda x: x if x > 0 else 0)
+                montos = valores_numericos[cols_numericas[0]]
+                result_df['Cargo'] = cargos(montos)
+                result_df['Abono'] = abonos(montos)
             elif len(cols_numericas) >= 2:
                 # Probablemente columnas separadas para cargo y abono
                 cargo_encontrado = False
                 abono_encontrado = False
                 
                 for col in cols_numericas:
-                    valores = pd.to_numeric(data_df[col], errors='coerce').fillna(0)
+                    valores = valores_numericos[col]
                     # Si la mayoría son negativos, probablemente es cargo
                     neg_count = (valores < 0).sum()
                     pos_count = (valores > 0).sum()
                     
                     if neg_count > pos_count and not cargo_encontrado:
-                        result_df['Cargo'] = valores.apply(lambda x: abs(x) if x < 0 else 0)
+                        result_df['Cargo'] = cargos(valores)
                         cargo_encontrado = True
                     elif pos_count > neg_count and not abono_encontrado:
-                        result_df['Abono'] = valores.apply(lambda x: x if x > 0 else 0)
+                        result_df['Abono'] = abonos(valores)
                         abono_encontrado = True
             
             # Determinar tipo - Corregir la lógica
@@ -569,20 +795,20 @@ def extraer_datos_bancochile_formato2(df):
             result_df.loc[ingresos_mask, 'Tipo'] = 'Ingreso'
             
             # Calcular monto final basado en el tipo
-            result_df['Monto'] = result_df.apply(
-                lambda row: row['Abono'] if row['Tipo'] == 'Ingreso' else row['Cargo'], 
-                axis=1
+            result_df['Monto'] = np.where(
+                result_df['Tipo'] == 'Ingreso', result_df['Abono'], result_df['Cargo']
             )
             
-            # Limpiar datos
-            result_df = result_df.dropna(subset=['Fecha'])
-            result_df = result_df[result_df['Monto'] != 0]
-            
-            # Filtrar filas de totales y subtotales
-            result_df = result_df[~result_df['Descripción'].astype(str).str.contains('total|subtotal|saldo', case=False)]
+            # Limpiar datos y filtrar filas de totales y subtotales con una sola
+            # máscara, en vez de un DataFrame intermedio por cada filtro
+            result_df = result_df.loc[
+                result_df['Fecha'].notna().to_numpy()
+                & (result_df['Monto'] != 0).to_numpy()
+                & ~contiene_texto(result_df['Descripción'], 'total|subtotal|saldo', case=False)
+            ]
             
             # Convertir a lista de diccionarios
-            movimientos = result_df[['Fecha', 'Descripción', 'Monto', 'Tipo']].to_dict(orient='records')
+            movimientos = registros(result_df, COLUMNAS_MOVIMIENTO)
             
             if movimientos and len(movimientos) > 0:
                 return saldo_disponible, movimientos
@@ -600,19 +826,29 @@ def extraer_datos_bancochile_analisis_estructural(df):
         # 1. Buscar regiones densas con datos no nulos
         regiones_candidatas = []
         
-        # Calcular la densidad de datos en bloques
-        for i in range(0, len(df) - 10, 5):
-            # Contar celdas no nulas en el bloque
-            bloque = df.iloc[i:i+10]
-            densidad = bloque.notna().sum().sum() / (bloque.shape[0] * bloque.shape[1])
+        # Calcular la densidad de datos en bloques de 10 filas cada 5 filas.
+        # Las celdas con datos y con números se marcan una sola vez para toda
+        # la hoja; el conteo de cada bloque sale de sumas acumuladas
+        inicios = np.arange(0, len(df) - 10, 5)
+        if inicios.size:
+            con_datos = df.notna().to_numpy()
+            con_numeros = np.column_stack([
+                pd.to_numeric(df.iloc[:, j], errors='coerce').notna().to_numpy()
+                for j in range(df.shape[1])
+            ])
+            acumulado_datos = np.concatenate(([0], np.cumsum(con_datos.sum(axis=1))))
+            acumulado_numeros = np.vstack((np.zeros((1, df.shape[1]), dtype=int), np.cumsum(con_numeros, axis=0)))
             
-            if densidad > 0.5:  # Al menos 50% de celdas con datos
-                # Verificar si hay columnas numéricas
-                num_cols = sum(1 for col in bloque.columns 
-                              if pd.to_numeric(bloque[col], errors='coerce').notna().sum() > 5)
-                
-                if num_cols >= 1:  # Al menos una columna con números
-                    regiones_candidatas.append((i, i+10, densidad, num_cols))
+            densidades = (acumulado_datos[inicios + 10] - acumulado_datos[inicios]) / (10 * df.shape[1])
+            # Columnas con más de 5 números dentro de cada bloque
+            columnas_numericas = ((acumulado_numeros[inicios + 10] - acumulado_numeros[inicios]) > 5).sum(axis=1)
+            
+            # Al menos 50% de celdas con datos y al menos una columna con números
+            validos = (densidades > 0.5) & (columnas_numericas >= 1)
+            regiones_candidatas = [
+                (int(i), int(i) + 10, float(densidad), int(num_cols))
+                for i, densidad, num_cols in zip(inicios[validos], densidades[validos], columnas_numericas[validos])
+            ]
         
         # Ordenar regiones por densidad y número de columnas numéricas
         regiones_candidatas.sort(key=lambda x: (x[2], x[3]), reverse=True)
@@ -620,7 +856,7 @@ def extraer_datos_bancochile_analisis_estructural(df):
         # Procesar cada región candidata
         for inicio, fin, densidad, num_cols in regiones_candidatas:
             # Extraer la región
-            bloque = df.iloc[inicio:fin].copy()
+            bloque = df.iloc[inicio:fin]
             
             # Buscar columnas con fechas
             fecha_cols = []
@@ -642,10 +878,10 @@ def extraer_datos_bancochile_analisis_estructural(df):
                     inicio_datos = 0
                 
                 # Extraer datos desde el inicio
-                data_df = bloque.iloc[inicio_datos:].copy()
+                data_df = bloque.iloc[inicio_datos:]
                 
                 # Generar encabezados genéricos
-                data_df.columns = [f"Col{i}" for i in range(data_df.shape[1])]
+                data_df = data_df.set_axis([f"Col{i}" for i in range(data_df.shape[1])], axis=1)
                 
                 # Identificar columnas clave
                 col_fecha_str = f"Col{bloque.columns.get_loc(col_fecha)}"
@@ -664,12 +900,14 @@ def extraer_datos_bancochile_analisis_estructural(df):
                 
                 # Buscar columnas numéricas (posibles montos)
                 col_montos = []
+                valores_numericos = {}
                 for col in data_df.columns:
                     if col not in [col_fecha_str, col_desc]:
                         # Verificar si la columna tiene valores numéricos
                         nums = pd.to_numeric(data_df[col], errors='coerce')
                         if nums.notna().sum() > 3:  # Al menos 3 valores numéricos
                             col_montos.append(col)
+                            valores_numericos[col] = nums.fillna(0)
                 
                 # Si tenemos fecha, descripción y algún monto, procesar
                 if col_desc and col_montos:
@@ -685,21 +923,21 @@ def extraer_datos_bancochile_analisis_estructural(df):
                     # Procesar columnas de montos
                     if len(col_montos) == 1:
                         # Una sola columna de monto (con signos)
-                        montos = pd.to_numeric(data_df[col_montos[0]], errors='coerce').fillna(0)
-                        result_df['Cargo'] = montos.apply(lambda x: abs(x) if x < 0 else 0)
-                        result_df['Abono'] = montos.apply(lambda x: x if x > 0 else 0)
+                        montos = valores_numericos[col_montos[0]]
+                        result_df['Cargo'] = cargos(montos)
+                        result_df['Abono'] = abonos(montos)
                     else:
                         # Múltiples columnas - intentar detectar cargo y abono
                         for col in col_montos:
-                            valores = pd.to_numeric(data_df[col], errors='coerce').fillna(0)
+                            valores = valores_numericos[col]
                             # Si la mayoría son negativos, probablemente es cargo
                             neg_count = (valores < 0).sum()
                             pos_count = (valores > 0).sum()
                             
                             if neg_count > pos_count:
-                                result_df['Cargo'] += valores.apply(lambda x: abs(x) if x < 0 else 0)
+                                result_df['Cargo'] += cargos(valores)
                             else:
-                                result_df['Abono'] += valores.apply(lambda x: x if x > 0 else 0)
+                                result_df['Abono'] += abonos(valores)
                     
                     # Determinar tipo - Corregir la lógica
                     # Siempre asignar según valores en Cargo y Abono
@@ -714,17 +952,15 @@ def extraer_datos_bancochile_analisis_estructural(df):
                     result_df.loc[ingresos_mask, 'Tipo'] = 'Ingreso'
                     
                     # Calcular monto final basado en el tipo
-                    result_df['Monto'] = result_df.apply(
-                        lambda row: row['Abono'] if row['Tipo'] == 'Ingreso' else row['Cargo'], 
-                        axis=1
+                    result_df['Monto'] = np.where(
+                        result_df['Tipo'] == 'Ingreso', result_df['Abono'], result_df['Cargo']
                     )
                     
-                    # Limpiar datos
-                    result_df = result_df.dropna(subset=['Fecha'])
-                    result_df = result_df[result_df['Monto'] != 0]
+                    # Limpiar datos: sin fecha o con monto cero, en un solo filtro
+                    result_df = result_df.loc[result_df['Fecha'].notna() & (result_df['Monto'] != 0)]
                     
                     # Convertir a lista de diccionarios
-                    movimientos = result_df[['Fecha', 'Descripción', 'Monto', 'Tipo']].to_dict(orient='records')
+                    movimientos = registros(result_df, COLUMNAS_MOVIMIENTO)
                     
                     if movimientos and len(movimientos) > 0:
                         return saldo_disponible, movimientos
@@ -743,26 +979,16 @@ def extraer_datos_bancochile_sin_encabezados(df):
         # y el resto es la tabla de movimientos
         
         # Buscar saldo en las primeras filas
-        for i in range(min(15, len(df))):
-            row_str = ' '.join([str(x).lower() for x in df.iloc[i].values if not pd.isna(x)])
-            if 'saldo' in row_str:
-                # Buscar valores numéricos en la fila
-                nums = [x for x in df.iloc[i].values if isinstance(x, (int, float)) and not pd.isna(x)]
-                if nums:
-                    saldo_disponible = float(nums[0])
-                    break
+        for i in np.flatnonzero(filas_con_terminos(texto_celdas(df.iloc[:15]), ['saldo'])):
+            # Buscar valores numéricos en la fila
+            nums = [x for x in df.iloc[i].values if isinstance(x, (int, float)) and not pd.isna(x)]
+            if nums:
+                saldo_disponible = float(nums[0])
+                break
         
         # Intentar detectar dónde comienza la tabla de datos
         # Buscar filas con fechas en la primera columna
-        fecha_indices = []
-        for i in range(len(df)):
-            cell = df.iloc[i, 0]
-            if isinstance(cell, (pd.Timestamp, datetime, date)):
-                fecha_indices.append(i)
-            elif isinstance(cell, str) and len(cell) >= 8:
-                # Verificar si parece una fecha
-                if any(x in cell for x in ['/', '-', '.']) and any(char.isdigit() for char in cell):
-                    fecha_indices.append(i)
+        fecha_indices = filas_con_fecha(df.iloc[:, 0]).tolist()
         
         if fecha_indices:
             # Encontrar secuencias continuas de fechas
@@ -787,10 +1013,10 @@ def extraer_datos_bancochile_sin_encabezados(df):
                 inicio_datos = secuencia_principal[0]
                 
                 # Extraer datos
-                data_df = df.iloc[inicio_datos:].copy()
+                data_df = df.iloc[inicio_datos:]
                 
                 # Asignar nombres genéricos a las columnas
-                data_df.columns = [f"Col{i}" for i in range(data_df.shape[1])]
+                data_df = data_df.set_axis([f"Col{i}" for i in range(data_df.shape[1])], axis=1)
                 
                 # Asumir columna 0 es fecha, columna 1 es descripción
                 result_df = pd.DataFrame()
@@ -818,28 +1044,30 @@ def extraer_datos_bancochile_sin_encabezados(df):
                 
                 # Buscar columnas numéricas para montos
                 col_montos = []
+                valores_numericos = {}
                 for i in range(data_df.shape[1]):
                     col = f"Col{i}"
                     if col not in ['Col0', col_desc]:
                         nums = pd.to_numeric(data_df[col], errors='coerce')
                         if nums.notna().sum() > 3:  # Al menos 3 valores numéricos
                             col_montos.append(col)
+                            valores_numericos[col] = nums.fillna(0)
                 
                 # Procesar columnas de montos
                 if col_montos:
                     if len(col_montos) == 1:
                         # Una sola columna con signos
-                        montos = pd.to_numeric(data_df[col_montos[0]], errors='coerce').fillna(0)
-                        result_df['Cargo'] = montos.apply(lambda x: abs(x) if x < 0 else 0)
-                        result_df['Abono'] = montos.apply(lambda x: x if x > 0 else 0)
+                        montos = valores_numericos[col_montos[0]]
+                        result_df['Cargo'] = cargos(montos)
+                        result_df['Abono'] = abonos(montos)
                     else:
                         # Intentar identificar cargos y abonos
                         for col in col_montos:
-                            valores = pd.to_numeric(data_df[col], errors='coerce').fillna(0)
+                            valores = valores_numericos[col]
                             if (valores < 0).sum() > (valores > 0).sum():
-                                result_df['Cargo'] += valores.apply(lambda x: abs(x) if x < 0 else 0)
+                                result_df['Cargo'] += cargos(valores)
                             else:
-                                result_df['Abono'] += valores.apply(lambda x: x if x > 0 else 0)
+                                result_df['Abono'] += abonos(valores)
                 
                 # Determinar tipo - Corregir la lógica
                 # Siempre asignar según valores en Cargo y Abono
@@ -854,17 +1082,15 @@ def extraer_datos_bancochile_sin_encabezados(df):
                 result_df.loc[ingresos_mask, 'Tipo'] = 'Ingreso'
                 
                 # Calcular monto final basado en el tipo
-                result_df['Monto'] = result_df.apply(
-                    lambda row: row['Abono'] if row['Tipo'] == 'Ingreso' else row['Cargo'], 
-                    axis=1
+                result_df['Monto'] = np.where(
+                    result_df['Tipo'] == 'Ingreso', result_df['Abono'], result_df['Cargo']
                 )
                 
-                # Limpiar datos
-                result_df = result_df.dropna(subset=['Fecha'])
-                result_df = result_df[result_df['Monto'] != 0]
+                # Limpiar datos: sin fecha o con monto cero, en un solo filtro
+                result_df = result_df.loc[result_df['Fecha'].notna() & (result_df['Monto'] != 0)]
                 
                 # Convertir a lista de diccionarios
-                movimientos = result_df[['Fecha', 'Descripción', 'Monto', 'Tipo']].to_dict(orient='records')
+                movimientos = registros(result_df, COLUMNAS_MOVIMIENTO)
                 
                 if movimientos and len(movimientos) > 0:
                     return saldo_disponible, movimientos
@@ -877,283 +1103,297 @@ def extraer_datos_bancochile_sin_encabezados(df):
 
 def extraer_datos_santander(archivo):
     """Extrae el saldo contable y movimientos de un archivo de Banco Santander."""
-    try:
-        # Cargar el archivo Excel
-        xls = pd.ExcelFile(archivo)
-        sheet_name = xls.sheet_names[0]
-        df = pd.read_excel(xls, sheet_name=sheet_name)
+    # Cargar la primera hoja directamente, sin abrir antes un ExcelFile
+    df = pd.read_excel(archivo, sheet_name=0, engine=EXCEL_ENGINE)
+    
+    logger.info(f"Procesando archivo Santander con forma: {df.shape}")
+    
+    # Inicializar variables
+    saldo_disponible = None
+    df_movimientos = None
+    
+    # Intento 1: Buscar la tabla de movimientos por encabezados, dejando
+    # margen para datos. Se buscan patrones comunes en encabezados de
+    # movimientos Santander sobre toda la hoja de una vez
+    candidatas, texto = buscar_filas_encabezado(
+        df.iloc[:max(len(df) - 5, 0)],
+        lambda texto: filas_con_terminos(texto, ["fecha", "descripción", "cargo", "abono", "detalle"]) > 0,
+    )
+    for i in candidatas:
+        row_text = " ".join(x for x in texto[i] if x)
+        logger.info(f"Encontrados posibles encabezados en fila {i}: {row_text}")
+
+        # Intentar extraer la tabla usando esta fila como encabezado
+        try:
+            # set_axis renombra sin consolidar la hoja en una matriz object
+            headers = [str(col).strip() for col in df.iloc[i]]
+            df_movimientos = df.iloc[i+1:].set_axis(headers, axis=1)
+
+            # Verificar si tenemos datos válidos
+            if len(df_movimientos) > 0:
+                logger.info(f"Tabla de movimientos extraída con {len(df_movimientos)} filas")
+                break
+        except Exception as e:
+            logger.warning(f"Error al extraer tabla en fila {i}: {str(e)}")
+    
+    # Si no se encontró la tabla, buscar por análisis de estructura
+    if df_movimientos is None:
+        logger.info("Buscando tabla por análisis de estructura...")
         
-        logger.info(f"Procesando archivo Santander con forma: {df.shape}")
+        # Buscar columnas numéricas (posibles montos) junto a columnas de texto.
+        # El tipo es de la columna completa, así que basta revisarlo una vez
+        # para toda la hoja en lugar de hacerlo por cada bloque de 10 filas:
+        # si la hoja califica, la tabla comienza en la primera fila
+        numeric_cols = df.select_dtypes(include=['number']).columns
+        if len(df) > 10 and len(numeric_cols) >= 2:  # Al menos dos columnas numéricas (cargo y abono)
+            # Verificar si hay texto que parece encabezados en esta área
+            text_cols = [col for col in df.columns if col not in numeric_cols]
+            if len(text_cols) >= 1:  # Al menos una columna de texto (descripción)
+                logger.info("Posible tabla encontrada en fila 0")
+                
+                # Crear nombres de columna si no son claros
+                headers = []
+                for j, col in enumerate(df.columns):
+                    if j in numeric_cols:
+                        if "cargo" not in headers and "abono" not in headers:
+                            headers.append("Cargo" if j % 2 == 0 else "Abono")
+                        else:
+                            headers.append("Monto" + str(j))
+                    else:
+                        if "fecha" not in headers:
+                            headers.append("Fecha")
+                        elif "descrip" not in headers and "detalle" not in headers:
+                            headers.append("Descripción")
+                        else:
+                            headers.append("Texto" + str(j))
+                
+                # Crear DataFrame con los datos de toda la hoja
+                df_movimientos = df.set_axis(headers, axis=1)
+    
+    # Procesar el DataFrame de movimientos si se encontró
+    if df_movimientos is not None:
+        # Eliminar filas sin fechas o con datos incompletos
+        df_movimientos = df_movimientos.dropna(thresh=3)  # Al menos 3 columnas con datos
         
-        # Inicializar variables
-        saldo_disponible = None
-        df_movimientos = None
+        # Buscar columnas clave
+        columnas = mapear_columnas(df_movimientos.columns, SANTANDER_COLUMNAS)
+        col_fecha = columnas.get("fecha")
+        col_descripcion = columnas.get("descripcion")
+        col_cargo = columnas.get("cargo")
+        col_abono = columnas.get("abono")
         
-        # Intento 1: Buscar la tabla de movimientos por encabezados
-        for i in range(len(df) - 5):  # Revisar todas las filas, dejando margen para datos
-            current_row = df.iloc[i:i+1]
-            row_text = " ".join([str(x).lower() for x in current_row.values.flatten() if pd.notna(x)])
-            
-            # Buscar patrones comunes en encabezados de movimientos Santander
-            if any(x in row_text for x in ["fecha", "descripción", "cargo", "abono", "detalle"]):
-                logger.info(f"Encontrados posibles encabezados en fila {i}: {row_text}")
-                
-                # Intentar extraer la tabla usando esta fila como encabezado
-                try:
-                    headers = [str(col).strip() for col in df.iloc[i]]
-                    df_movimientos = pd.DataFrame(df.iloc[i+1:].values, columns=headers)
-                    
-                    # Verificar si tenemos datos válidos
-                    if len(df_movimientos) > 0:
-                        logger.info(f"Tabla de movimientos extraída con {len(df_movimientos)} filas")
-                        break
-                except Exception as e:
-                    logger.warning(f"Error al extraer tabla en fila {i}: {str(e)}")
+        logger.info(f"Columnas identificadas: Fecha={col_fecha}, Desc={col_descripcion}, Cargo={col_cargo}, Abono={col_abono}")
         
-        # Si no se encontró la tabla, buscar por análisis de estructura
-        if df_movimientos is None:
-            logger.info("Buscando tabla por análisis de estructura...")
+        # Verificar que tenemos las columnas mínimas necesarias
+        if col_fecha is not None and col_descripcion is not None and (col_cargo is not None or col_abono is not None):
+            # Crear DataFrame final con columnas estandarizadas en una sola
+            # construcción; las columnas de cargo/abono ausentes quedan en 0
+            df_final = pd.DataFrame({
+                "Fecha": df_movimientos[col_fecha],
+                "Descripción": df_movimientos[col_descripcion],
+                "Cargo": convertir_montos(df_movimientos[col_cargo]) if col_cargo is not None else 0,
+                "Abono": convertir_montos(df_movimientos[col_abono]) if col_abono is not None else 0,
+            })
             
-            # Buscar bloques de texto que contengan columnas numéricas (posibles montos)
-            for i in range(len(df) - 10):
-                numeric_cols = df.iloc[i:i+10].select_dtypes(include=['number']).columns
-                if len(numeric_cols) >= 2:  # Al menos dos columnas numéricas (cargo y abono)
-                    # Verificar si hay texto que parece encabezados en esta área
-                    text_cols = [col for col in df.columns if col not in numeric_cols]
-                    if len(text_cols) >= 1:  # Al menos una columna de texto (descripción)
-                        logger.info(f"Posible tabla encontrada en fila {i}")
-                        
-                        # Crear nombres de columna si no son claros
-                        headers = []
-                        for j, col in enumerate(df.columns):
-                            if j in numeric_cols:
-                                if "cargo" not in headers and "abono" not in headers:
-                                    headers.append("Cargo" if j % 2 == 0 else "Abono")
-                                else:
-                                    headers.append("Monto" + str(j))
-                            else:
-                                if "fecha" not in headers:
-                                    headers.append("Fecha")
-                                elif "descrip" not in headers and "detalle" not in headers:
-                                    headers.append("Descripción")
-                                else:
-                                    headers.append("Texto" + str(j))
-                        
-                        # Crear DataFrame con datos desde esta fila
-                        df_movimientos = pd.DataFrame(df.iloc[i:].values, columns=headers)
-                        break
-        
-        # Procesar el DataFrame de movimientos si se encontró
-        if df_movimientos is not None:
-            # Eliminar filas sin fechas o con datos incompletos
-            df_movimientos = df_movimientos.dropna(thresh=3)  # Al menos 3 columnas con datos
+            # Si existe una columna de monto que puede tener valores positivos (abonos) y negativos (cargos)
+            col_monto = columnas.get("monto")
+            if col_monto is not None:
+                df_final["Monto"] = convertir_montos(df_movimientos[col_monto])
+                # Los cargos son negativos, los abonos positivos
+                df_final["Cargo"] = df_final["Cargo"].fillna(0) + cargos(df_final["Monto"])
+                df_final["Abono"] = df_final["Abono"].fillna(0) + abonos(df_final["Monto"])
             
-            # Buscar columnas clave
-            col_fecha = next((col for col in df_movimientos.columns if "fecha" in str(col).lower()), None)
-            col_descripcion = next((col for col in df_movimientos.columns 
-                                   if any(x in str(col).lower() for x in ["descrip", "detalle", "glosa", "concepto"])), None)
-            col_cargo = next((col for col in df_movimientos.columns 
-                             if any(x in str(col).lower() for x in ["cargo", "débito", "debito"])), None)
-            col_abono = next((col for col in df_movimientos.columns 
-                             if any(x in str(col).lower() for x in ["abono", "crédito", "credito"])), None)
+            # Determinar el tipo de transacción
+            df_final["Tipo"] = "Gasto"
+            df_final.loc[df_final["Abono"] > 0, "Tipo"] = "Ingreso"
             
-            logger.info(f"Columnas identificadas: Fecha={col_fecha}, Desc={col_descripcion}, Cargo={col_cargo}, Abono={col_abono}")
+            # Calcular monto total (positivo para ambos tipos)
+            df_final["Monto"] = df_final["Cargo"] + df_final["Abono"]
             
-            # Verificar que tenemos las columnas mínimas necesarias
-            if col_fecha is not None and col_descripcion is not None and (col_cargo is not None or col_abono is not None):
-                # Crear DataFrame final con columnas estandarizadas
-                df_final = pd.DataFrame()
-                df_final["Fecha"] = df_movimientos[col_fecha]
-                df_final["Descripción"] = df_movimientos[col_descripcion]
-                
-                # Inicializar columnas numéricas
-                df_final["Cargo"] = 0
-                df_final["Abono"] = 0
-                
-                # Función para convertir valores a números
-                def parse_monto(valor):
-                    if pd.isna(valor):
-                        return 0
-                    if isinstance(valor, (int, float)):
-                        return valor
-                    try:
-                        # Limpiar el valor (quitar símbolos, separadores, etc.)
-                        valor_str = str(valor).replace('$', '').replace('.', '').replace(',', '.').strip()
-                        return float(valor_str)
-                    except:
-                        return 0
-                
-                # Procesar columnas de cargo y abono
-                if col_cargo is not None:
-                    df_final["Cargo"] = pd.to_numeric(df_movimientos[col_cargo], errors="coerce")
-                if col_abono is not None:
-                    df_final["Abono"] = pd.to_numeric(df_movimientos[col_abono], errors="coerce")
-                
-                # Si existe una columna de monto que puede tener valores positivos (abonos) y negativos (cargos)
-                if "Monto" in df_movimientos.columns or any("monto" in str(col).lower() for col in df_movimientos.columns):
-                    col_monto = next((col for col in df_movimientos.columns if "monto" in str(col).lower()), None)
-                    if col_monto:
-                        df_final["Monto"] = pd.to_numeric(df_movimientos[col_monto], errors="coerce")
-                        # Los cargos son negativos, los abonos positivos
-                        df_final["Cargo"] = df_final["Cargo"].fillna(0) + df_final["Monto"].apply(lambda x: abs(x) if x < 0 else 0)
-                        df_final["Abono"] = df_final["Abono"].fillna(0) + df_final["Monto"].apply(lambda x: x if x > 0 else 0)
-                
-                # Determinar el tipo de transacción
-                df_final["Tipo"] = "Gasto"
-                df_final.loc[df_final["Abono"] > 0, "Tipo"] = "Ingreso"
-                
-                # Calcular monto total (positivo para ambos tipos)
-                df_final["Monto"] = df_final["Cargo"] + df_final["Abono"]
-                
-                # Limpiar datos - eliminar filas sin montos o con fechas inválidas
-                df_final = df_final[df_final["Monto"] > 0]  # Solo montos positivos > 0
-                df_final = df_final[~df_final["Fecha"].astype(str).str.contains("Total|TOTAL|Subtotal", case=False)]
-                
-                # Formatear datos para el resultado final
-                movimientos_santander = df_final[["Fecha", "Descripción", "Monto", "Tipo"]].to_dict(orient="records")
-                
-                logger.info(f"Extraídos {len(movimientos_santander)} movimientos de Santander")
-                if movimientos_santander:
-                    logger.debug(f"Primer movimiento: {movimientos_santander[0]}")
-                
-                return saldo_disponible or 0, movimientos_santander
-            else:
-                logger.warning("No se encontraron columnas necesarias en los datos")
-                return 0, []
+            # Limpiar datos - eliminar filas sin montos o con fechas inválidas
+            # Solo montos positivos > 0 y sin filas de totales, en un solo filtro
+            df_final = df_final.loc[
+                (df_final["Monto"] > 0).to_numpy()
+                & ~contiene_texto(df_final["Fecha"], "Total|TOTAL|Subtotal", case=False)
+            ]
+            
+            # Formatear datos para el resultado final
+            movimientos_santander = registros(df_final, COLUMNAS_MOVIMIENTO)
+            
+            logger.info(f"Extraídos {len(movimientos_santander)} movimientos de Santander")
+            if movimientos_santander:
+                logger.debug("Primer movimiento: %s", movimientos_santander[0])
+            
+            return saldo_disponible or 0, movimientos_santander
         else:
-            logger.warning("No se pudo identificar la tabla de movimientos")
+            logger.warning("No se encontraron columnas necesarias en los datos")
             return 0, []
-    
-    except Exception as e:
-        logger.error(f"Error al procesar archivo de Banco Santander: {str(e)}", exc_info=True)
+    else:
+        logger.warning("No se pudo identificar la tabla de movimientos")
         return 0, []
 
 
 def extraer_datos_bci(archivo):
     """Extrae el saldo contable y movimientos de un archivo de BCI."""
-    try:
-        # Cargar el archivo Excel
-        xls = pd.ExcelFile(archivo)
-        sheet_name = xls.sheet_names[0]
-        df = pd.read_excel(xls, sheet_name=sheet_name)
+    # Cargar la primera hoja directamente, sin abrir antes un ExcelFile
+    df = pd.read_excel(archivo, sheet_name=0, engine=EXCEL_ENGINE)
 
-        # No hay saldo para BCI según requerimientos
-        saldo_bci = 0
+    # No hay saldo para BCI según requerimientos
+    saldo_bci = 0
 
-        # Buscar columnas con información de movimientos
-        header_row = None
-        for i, row in df.iterrows():
-            row_str = row.to_string().lower()
-            if (
-                "fecha" in row_str
-                and any(term in row_str for term in ["transacción", "transaccion", "detalle", "descripción"])
-                and any(term in row_str for term in ["cargo", "débito", "abono", "crédito", "monto"])
-            ):
-                header_row = i
-                break
+    # Buscar columnas con información de movimientos: la primera fila que
+    # tenga fecha, detalle y monto
+    header_row = None
+    candidatas, _ = buscar_filas_encabezado(
+        df,
+        lambda texto: (
+            (filas_con_terminos(texto, ["fecha"]) > 0)
+            & (filas_con_terminos(texto, ["transacción", "transaccion", "detalle", "descripción"]) > 0)
+            & (filas_con_terminos(texto, ["cargo", "débito", "abono", "crédito", "monto"]) > 0)
+        ),
+    )
+    if candidatas.size:
+        header_row = int(candidatas[0])
 
-        if header_row is not None:
-            df_movimientos = df.iloc[header_row + 1:].copy()
-            df_movimientos.columns = df.iloc[header_row]
+    if header_row is not None:
+        df_movimientos = df.iloc[header_row + 1:].set_axis(df.iloc[header_row].tolist(), axis=1)
+        
+        # Mapear las columnas necesarias
+        found_columns = mapear_columnas(df_movimientos.columns, BCI_COLUMNAS)
+        
+        # Verificar que tenemos las columnas mínimas necesarias
+        if "Fecha" in found_columns and "Descripción" in found_columns and any(k in found_columns for k in ["Cargo", "Abono", "Monto"]):
+            # Crear DataFrame con columnas estandarizadas en una sola
+            # construcción; las columnas de cargo/abono ausentes quedan en 0
+            df_final = pd.DataFrame({
+                "Fecha": df_movimientos[found_columns["Fecha"]],
+                "Descripción": df_movimientos[found_columns["Descripción"]],
+                "Cargo": convertir_montos(df_movimientos[found_columns["Cargo"]]) if "Cargo" in found_columns else 0,
+                "Abono": convertir_montos(df_movimientos[found_columns["Abono"]]) if "Abono" in found_columns else 0,
+            })
             
-            # Mapear las columnas necesarias
-            column_mapping = {
-                "Fecha": ["Fecha", "Fecha Transacción", "FECHA"],
-                "Descripción": ["Descripción", "DESCRIPCION", "Detalle", "Glosa"],
-                "Cargo": ["Cargo", "CARGO", "Débito", "Monto Débito"],
-                "Abono": ["Abono", "ABONO", "Crédito", "Monto Crédito"],
-                "Monto": ["Monto", "MONTO", "Valor"]
-            }
+            # Si hay una columna de monto que puede contener valores positivos y negativos
+            if "Monto" in found_columns:
+                montos = convertir_montos(df_movimientos[found_columns["Monto"]])
+                df_final["Cargo"] += cargos(montos)
+                df_final["Abono"] += abonos(montos)
             
-            # Buscar las columnas en el dataframe
-            found_columns = {}
-            for target_col, possible_names in column_mapping.items():
-                for col_name in df_movimientos.columns:
-                    col_str = str(col_name).lower()
-                    if any(possible.lower() in col_str for possible in possible_names):
-                        found_columns[target_col] = col_name
-                        break
+            # Determinar el tipo de transacción
+            df_final["Tipo"] = "Gasto"
+            df_final.loc[df_final["Abono"] > 0, "Tipo"] = "Ingreso"
             
-            # Verificar que tenemos las columnas mínimas necesarias
-            if "Fecha" in found_columns and "Descripción" in found_columns and any(k in found_columns for k in ["Cargo", "Abono", "Monto"]):
-                # Crear DataFrame con columnas estandarizadas
-                df_final = pd.DataFrame()
-                df_final["Fecha"] = df_movimientos[found_columns["Fecha"]]
-                df_final["Descripción"] = df_movimientos[found_columns["Descripción"]]
-                
-                # Inicializar columnas numéricas
-                df_final["Cargo"] = 0
-                df_final["Abono"] = 0
-                
-                # Función para convertir strings con formato de moneda chilena a números
-                def parse_chilean_amount(value):
-                    if pd.isna(value):
-                        return 0
-                    
-                    # Si ya es un número, devolverlo directamente
-                    if isinstance(value, (int, float)):
-                        return value
-                    
-                    # Convertir a string si no lo es
-                    value_str = str(value)
-                    
-                    # Reemplazar puntos (separadores de miles) y comas (separadores decimales)
-                    # En Chile: 1.234,56 = 1234.56 en formato inglés
-                    cleaned_value = value_str.replace('.', '').replace(',', '.')
-                    
-                    try:
-                        return float(cleaned_value)
-                    except ValueError:
-                        # Si hay error, intentar extraer solo dígitos y puntos/comas
-                        import re
-                        numeric_chars = re.sub(r'[^\d,.]', '', value_str)
-                        if numeric_chars:
-                            numeric_chars = numeric_chars.replace('.', '').replace(',', '.')
-                            try:
-                                return float(numeric_chars)
-                            except ValueError:
-                                return 0
-                        return 0
-                
-                # Procesar columnas de montos con la nueva función
-                if "Cargo" in found_columns:
-                    df_final["Cargo"] = df_movimientos[found_columns["Cargo"]].apply(parse_chilean_amount)
-                
-                if "Abono" in found_columns:
-                    df_final["Abono"] = df_movimientos[found_columns["Abono"]].apply(parse_chilean_amount)
-                
-                # Si hay una columna de monto que puede contener valores positivos y negativos
-                if "Monto" in found_columns:
-                    montos = df_movimientos[found_columns["Monto"]].apply(parse_chilean_amount)
-                    df_final["Cargo"] += montos.apply(lambda x: abs(x) if x < 0 else 0)
-                    df_final["Abono"] += montos.apply(lambda x: x if x > 0 else 0)
-                
-                # Determinar el tipo de transacción
-                df_final["Tipo"] = "Gasto"
-                df_final.loc[df_final["Abono"] > 0, "Tipo"] = "Ingreso"
-                
-                # Calcular el monto final (positivo para ambos tipos)
-                df_final["Monto"] = df_final["Cargo"] + df_final["Abono"]
-                
-                # Registrar algunos montos para verificación
-                logger.debug(f"Ejemplos de montos procesados: {df_final['Monto'].head().tolist()}")
-                
-                # Filtrar filas con valores nulos y montos cero
-                df_final = df_final.dropna(subset=["Fecha", "Monto"])
-                df_final = df_final[df_final["Monto"] != 0]
-                
-                # Convertir a lista de diccionarios
-                movimientos_bci = df_final[["Fecha", "Descripción", "Monto", "Tipo"]].to_dict(orient="records")
-                return saldo_bci, movimientos_bci
-            else:
-                return saldo_bci, []
+            # Calcular el monto final (positivo para ambos tipos)
+            df_final["Monto"] = df_final["Cargo"] + df_final["Abono"]
+            
+            # Registrar algunos montos para verificación, solo si se va a emitir
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Ejemplos de montos procesados: %s", df_final["Monto"].head().tolist())
+            
+            # Filtrar filas sin fecha y montos cero (convertir_montos ya
+            # deja en 0 los montos que no se pudieron interpretar)
+            df_final = df_final.loc[df_final["Fecha"].notna() & (df_final["Monto"] != 0)]
+            
+            # Convertir a lista de diccionarios
+            movimientos_bci = registros(df_final, COLUMNAS_MOVIMIENTO)
+            return saldo_bci, movimientos_bci
         else:
             return saldo_bci, []
-    except Exception as e:
-        logger.error(f"Error al procesar archivo de BCI: {str(e)}", exc_info=True)
+    else:
+        return saldo_bci, []
+
+
+def procesar_reporte(parser, archivo):
+    """
+    Ejecuta el extractor de un banco y centraliza el manejo de sus errores.
+
+    Cualquier error al leer o interpretar el archivo (formato no reconocido,
+    archivo corrupto, columnas faltantes, etc.) se registra con su traza y se
+    trata como un reporte sin movimientos.
+
+    Returns:
+        tuple: (saldo, movimientos) o (0, []) si el archivo no se pudo procesar
+    """
+    try:
+        return parser(archivo)
+    except Exception:
+        logger.exception("Error al procesar el reporte bancario con %s", parser.__name__)
         return 0, []
 
 
+# Extractor de cada banco soportado por /upload-bank-report
+BANK_PARSERS = {
+    "bancoestado": extraer_datos_bancoestado,
+    "bancochile": extraer_datos_bancochile,
+    "bancosantander": extraer_datos_santander,
+    "bancobci": extraer_datos_bci,
+}
+VALID_BANK_IDS_TEXT = ", ".join(sorted(BANK_PARSERS))
+
+# Versión de los extractores y del formato de la respuesta. Forma parte de la
+# clave del caché de reportes: se incrementa al corregir un extractor para no
+# devolver resultados calculados con la versión anterior
+REPORT_PARSER_VERSION = 1
+
+# Procesos para leer los reportes bancarios. El parseo con pandas es
+# intensivo en CPU: en un hilo compite por el GIL con el resto de la API y
+# dos cargas simultáneas no avanzan en paralelo
+REPORT_POOL_WORKERS = max(1, min(4, os.cpu_count() or 1))
+_report_pool = None
+
+
+def start_report_pool() -> None:
+    """
+    Crea el pool de procesos de reportes (al iniciar la aplicación).
+
+    Los procesos se crean con forkserver (o spawn si no está disponible) y no
+    con fork: la API ya tiene hilos en ejecución (threadpool, conexiones) y un
+    fork copiaría sus locks en el estado en que estén.
+    """
+    global _report_pool
+    if _report_pool is None:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn"
+        )
+        _report_pool = ProcessPoolExecutor(
+            max_workers=REPORT_POOL_WORKERS, mp_context=context
+        )
+
+
+def shutdown_report_pool() -> None:
+    """Detiene los procesos del pool de reportes (al apagar la aplicación)"""
+    global _report_pool
+    if _report_pool is not None:
+        _report_pool.shutdown(cancel_futures=True)
+        _report_pool = None
+
+
+async def procesar_reporte_en_pool(parser, archivo):
+    """
+    Ejecuta procesar_reporte en el pool de procesos sin bloquear el event loop.
+
+    Si el pool no está iniciado el reporte se procesa en un hilo. Si un proceso
+    del pool terminó de forma abrupta el pool queda inutilizable: se detiene y
+    se reemplaza por uno nuevo, y este reporte se procesa en un hilo.
+    """
+    global _report_pool
+    pool = _report_pool
+    if pool is None:
+        return await run_in_threadpool(procesar_reporte, parser, archivo)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, procesar_reporte, parser, archivo)
+    except BrokenProcessPool:
+        logger.warning("El pool de procesos de reportes falló; se procesa en un hilo")
+        # Otra carga pudo haberlo reemplazado ya
+        if _report_pool is pool:
+            _report_pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            start_report_pool()
+        return await run_in_threadpool(procesar_reporte, parser, archivo)
+
+
+
 # Modelo para recibir transacciones en masa
 class TransactionInput(BaseModel):
     fecha: Union[str, date, datetime]
@@ -1185,20 +1425,13 @@ async def create_bulk_transactions(transactions: List[TransactionInput] = Body(.
     
     # Convertimos todas las fechas al formato de la base de datos
     processed_transactions = []
+    date_format = None  # Formato detectado en la primera fila, reutilizado en las siguientes
     for t in transactions:
         # Convertir la fecha si viene como string
         if isinstance(t.fecha, str):
             try:
-                # Intentar varios formatos de fecha comunes
-                for date_format in ['%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%m/%d/%Y']:
-                    try:
-                        parsed_date = datetime.strptime(t.fecha, date_format).date()
-                        break
-                    except ValueError:
-                        continue
-                else:  # Si ningún formato funciona
-                    raise ValueError(f"Formato de fecha no reconocido: {t.fecha}")
-            except Exception as e:
+                parsed_date, date_format = parse_date(t.fecha, date_format)
+            except ValueError as e:
                 logger.error(f"Error al procesar fecha {t.fecha}: {str(e)}")
                 raise HTTPException(
                     status_code=400, 
@@ -1227,27 +1460,13 @@ async def create_bulk_transactions(transactions: List[TransactionInput] = Body(.
             "tipo": tipo  # Usamos el tipo determinado
         })
     
-    # Verificar duplicados y crear nuevas transacciones
+    # Insertar solo las transacciones que no existen (por fecha, descripción y monto)
+    new_ids, duplicates_count = await insert_new_rows(Transaction, processed_transactions)
     inserted_transactions = []
-    duplicates_count = 0
-    
-    for trans_data in processed_transactions:
-        # Buscar si ya existe una transacción igual por fecha, descripción y monto
-        existing = await Transaction.filter(
-            transaction_date=trans_data["transaction_date"],
-            description=trans_data["description"],
-            amount=trans_data["amount"]
-        ).first()
-        
-        if existing:
-            duplicates_count += 1
-            logger.info(f"Transacción duplicada: {trans_data}")
-            continue
-        
-        # Si no existe, crear nueva transacción
-        transaction_obj = await Transaction.create(**trans_data)
-        trans_pydantic = await Transaction_Pydantic.from_tortoise_orm(transaction_obj)
-        inserted_transactions.append(trans_pydantic)
+    if new_ids:
+        inserted_transactions = await Transaction_Pydantic.from_queryset(
+            Transaction.filter(id__in=new_ids).order_by("id")
+        )
         
     return {
         "total_recibidas": len(transactions),
@@ -1266,6 +1485,11 @@ class TransactionWithType(BaseModel):
     bank_id: Optional[int] = None
     tipo: str  # Campo adicional para el tipo (Ingreso/Gasto)
 
+# Columnas de la tabla que se devuelven en TransactionWithType (tipo se calcula)
+TRANSACTION_WITH_TYPE_FIELDS = (
+    "id", "transaction_date", "description", "amount", "category", "bank_id"
+)
+
 @router.get("/transactions-by-month", response_model=List[TransactionWithType])
 async def get_transactions_by_month(
     month: int = Query(..., ge=1, le=12, description="Mes (1-12)"),
@@ -1281,38 +1505,27 @@ async def get_transactions_by_month(
         Lista de transacciones correspondientes al mes y año especificados.
     """
     try:
-        # Calcular el último día del mes
-        last_day = calendar.monthrange(year, month)[1]
-        
-        # Crear fechas de inicio y fin para el filtro
-        start_date = date(year, month, 1)
-        end_date = date(year, month, last_day)
+        # Rango semiabierto del mes: desde el día 1 hasta el día 1 del mes siguiente
+        start_date, end_date = month_range(year, month)
         
         # Filtrar transacciones por el rango de fechas
         query = Transaction.filter(
             transaction_date__gte=start_date,
-            transaction_date__lte=end_date
+            transaction_date__lt=end_date
         ).order_by('transaction_date')
         
-        # Obtener transacciones
-        transactions = await Transaction_Pydantic.from_queryset(query)
-        
-        # Procesar las transacciones para agregar el campo tipo y formatear los montos
-        processed_transactions = []
+        # Obtener solo las columnas de la respuesta, sin construir un modelo
+        # Pydantic por fila. El monto se lee con el campo del modelo, que lo
+        # redondea (mitad al par) igual que en /transactions, y el tipo se
+        # calcula según el signo del monto ya redondeado
+        transactions = await query.values(*TRANSACTION_WITH_TYPE_FIELDS)
         for transaction in transactions:
-            # Convertir a diccionario para manipulación
-            trans_dict = transaction.dict()
-            
-            # Eliminar decimales en el campo amount
-            trans_dict["amount"] = int(trans_dict["amount"])
-            
-            # Agregar campo tipo basado en el monto
-            trans_dict["tipo"] = "Gasto" if trans_dict["amount"] < 0 else "Ingreso"
-            
-            # Agregar a la lista como instancia del nuevo modelo
-            processed_transactions.append(TransactionWithType(**trans_dict))
+            amount = int(transaction["amount"])
+            transaction["amount"] = amount
+            transaction["tipo"] = "Gasto" if amount < 0 else "Ingreso"
         
-        return processed_transactions
+        # orjson serializa la lista en C, sin validarla de nuevo contra response_model
+        return ORJSONResponse(transactions)
     
     except Exception as e:
         logger.error(f"Error al obtener transacciones por mes: {str(e)}", exc_info=True)
@@ -1353,17 +1566,13 @@ async def get_transactions_grouped_by_month(
         Incluye el ID del banco, nombre del banco y el detalle de las transacciones en cada grupo.
     """
     try:
-        # Calcular el último día del mes
-        last_day = calendar.monthrange(year, month)[1]
-        
-        # Crear fechas de inicio y fin para el filtro
-        start_date = date(year, month, 1)
-        end_date = date(year, month, last_day)
+        # Rango semiabierto del mes: desde el día 1 hasta el día 1 del mes siguiente
+        start_date, end_date = month_range(year, month)
         
         # Obtener todas las transacciones del mes para procesamiento posterior
         transactions = await Transaction.filter(
             transaction_date__gte=start_date,
-            transaction_date__lte=end_date
+            transaction_date__lt=end_date
         ).prefetch_related('bank')
         
         # Agrupar por descripción y banco
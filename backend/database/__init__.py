@@ -1,31 +1,88 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 import os
 
 # Configuración de la base de datos
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./contable.db")
 
-# Configurar el motor de la base de datos
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Motor síncrono, solo para scripts de mantenimiento como setup_db.py.
+# check_same_thread es una opción exclusiva del driver de SQLite
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+)
+
+# Equivalente asíncrono de cada driver síncrono
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+}
+
+def get_async_url(url: str) -> str:
+    """Traduce la URL de conexión al driver asíncrono del mismo motor"""
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+# Pool de conexiones reutilizables para motores de red. pool_pre_ping descarta
+# conexiones cortadas por el servidor y pool_recycle las renueva antes de que
+# MySQL las cierre por inactividad (wait_timeout)
+POOL_OPTIONS = {
+    "pool_size": 20,
+    "max_overflow": 10,
+    "pool_pre_ping": True,
+    "pool_recycle": 3600,
+}
+
+# Motor asíncrono usado por los endpoints, para no bloquear el event loop.
+# SQLite es un archivo local y no usa pool de conexiones de red
+async_engine = create_async_engine(
+    get_async_url(DATABASE_URL),
+    # Filas por sentencia cuando un insert() de Core se ejecuta con una lista
+    # de parámetros y SQLAlchemy lo agrupa en INSERTs con múltiples VALUES
+    insertmanyvalues_page_size=1000,
+    **({} if DATABASE_URL.startswith("sqlite") else POOL_OPTIONS)
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
 Base = declarative_base()
 
 # Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+def upsert_statement(db, model, values, conflict_columns, update_values):
+    """
+    Construye un INSERT que actualiza la fila existente si hay conflicto de clave única.
+
+    Usa la variante propia del motor: ON DUPLICATE KEY UPDATE en MySQL y
+    ON CONFLICT DO UPDATE en SQLite/PostgreSQL.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        return insert(model).values(**values).on_duplicate_key_update(**update_values)
+
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model).values(**values).on_conflict_do_update(
+        index_elements=conflict_columns, set_=update_values
+    )
 
 # Función para crear todas las tablas
-def create_tables():
+async def create_tables():
     # Importamos aquí para evitar problemas de importación circular
     from models.budget import Budget, BudgetCategory, SubcategoryBudget
-    from models.category import Category
+    from models.category import Category, CategoryKeyword
     from models.transaction import Transaction
     
-    Base.metadata.create_all(bind=engine)
+    # create_all es síncrono: se ejecuta sobre la conexión asíncrona con run_sync
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
     print("Tablas creadas o verificadas exitosamente.")
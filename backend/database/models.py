@@ -80,3 +80,6 @@ class IncomeTransaction(models.Model):
 
     class Meta:
         table = "transacciones_ingresos"
+        # Rango por mes ordenado por fecha y búsqueda de duplicados por
+        # (fecha, descripción, monto) en la carga masiva
+        indexes = (("transaction_date", "description", "amount"),)
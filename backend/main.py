@@ -2,39 +2,57 @@
 
 import os
 import sys
-# Agregar el directorio actual al PYTHONPATH
-sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+# Agregar el directorio actual al PYTHONPATH, solo si no está ya (al ejecutar
+# main.py directamente o con uvicorn desde backend/ ya es sys.path[0])
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
 
+import logging
 from contextlib import asynccontextmanager
 
 import uvicorn
 from api.banks import router as banks_router
-from api.transactions import router as transactions_router
+from api.transactions import router as transactions_router, shutdown_report_pool, start_report_pool
 from api.income_transactions import router as income_transactions_router
 from api.budget_routes import router as budget_router
 from api.category_routes import router as category_router
-from database import create_tables
+from database import async_engine, create_tables
 from database.connection import close_db, init_db
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from tortoise.contrib.fastapi import register_tortoise
 from config.cors import setup_cors
 
-# Crear tablas de SQLAlchemy al iniciar la aplicación
-create_tables()
+# Configuración de logs de toda la aplicación, una sola vez al arrancar
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler(sys.stdout)],
+)
+
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
     """Manejador de eventos de ciclo de vida de la aplicación"""
     # Código que se ejecuta al iniciar la aplicación
     await init_db()
+    # Crear tablas de SQLAlchemy sin bloquear el event loop
+    await create_tables()
+    # Procesos para leer los reportes bancarios subidos
+    start_report_pool()
     yield
     # Código que se ejecuta al detener la aplicación
     await close_db()
+    await async_engine.dispose()
+    shutdown_report_pool()
 
 app = FastAPI(
     title="Contable API",
     description="API para la aplicación de gestión financiera MoneyDairy",
+    # orjson serializa directamente en C, sin pasar por jsonable_encoder
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -6,6 +6,9 @@ from database import Base  # Cambiar a importación absoluta
 
 class Budget(Base):
     __tablename__ = "budgets"
+    # Recupera los valores generados por el servidor (id, created_at,
+    # updated_at) durante el flush, sin un refresh posterior
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
@@ -25,6 +28,7 @@ class Budget(Base):
 
 class BudgetCategory(Base):
     __tablename__ = "budget_categories"
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     budget_id = Column(Integer, ForeignKey("budgets.id", ondelete="CASCADE"), nullable=False)
@@ -41,6 +45,7 @@ class BudgetCategory(Base):
 
 class SubcategoryBudget(Base):
     __tablename__ = "subcategory_budgets"
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     budget_id = Column(Integer, ForeignKey("budgets.id", ondelete="CASCADE"), nullable=False)
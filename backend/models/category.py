@@ -1,22 +1,42 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
 
 # Cambiar a importación absoluta
 from database import Base
 
 class Category(Base):
     __tablename__ = "categories"
+    # Recupera los valores generados por el servidor (id, created_at,
+    # updated_at) durante el flush, sin un refresh posterior
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
     description = Column(String(255), nullable=True)
     color = Column(String(50), nullable=True)  # Para representación visual
     parent_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Cubre las búsquedas por padre y el MAX(updated_at) de los listados
+        Index('idx_categories_parent_updated', 'parent_id', 'updated_at'),
+    )
     
-    # Corregir la relación recursiva para subcategorías
-    subcategories = relationship(
-        "Category", 
-        backref="parent",
-        remote_side=[id],
-        cascade="all"  # Eliminar "delete-orphan" de la cascada
+    # Relación recursiva: remote_side apunta al lado "uno" (la categoría padre).
+    # El borrado de subcategorías lo resuelve el ON DELETE CASCADE de la base de datos
+    parent = relationship("Category", remote_side=[id], back_populates="subcategories")
+    subcategories = relationship("Category", back_populates="parent", passive_deletes=True)
+
+class CategoryKeyword(Base):
+    __tablename__ = "category_keywords"
+
+    id = Column(Integer, primary_key=True, index=True)
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), nullable=False)
+    keyword = Column(String(100), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('category_id', 'keyword', name='unique_category_keyword'),
     )
@@ -0,0 +1,40 @@
+"""Conversión de fechas recibidas como texto en las cargas masivas de transacciones"""
+
+from datetime import date, datetime
+from typing import Optional
+
+# Formatos de fecha aceptados en la carga masiva, en orden de prioridad
+DATE_FORMATS = ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%m/%d/%Y')
+
+
+def _parse_with_format(value: str, date_format: str) -> date:
+    """Convierte una fecha con un formato concreto, usando el parser ISO en C cuando aplica"""
+    if date_format == '%Y-%m-%d':
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            pass  # strptime también acepta días y meses sin ceros a la izquierda
+    return datetime.strptime(value, date_format).date()
+
+
+def parse_date(value: str, cached_format: Optional[str] = None):
+    """
+    Convierte una fecha probando primero el formato que funcionó en la fila anterior.
+
+    Returns:
+        Tupla (fecha, formato usado) para reutilizar el formato en la siguiente fila.
+    """
+    if cached_format is not None:
+        try:
+            return _parse_with_format(value, cached_format), cached_format
+        except ValueError:
+            pass  # El archivo cambió de formato: volver a detectarlo
+
+    for date_format in DATE_FORMATS:
+        if date_format == cached_format:
+            continue
+        try:
+            return _parse_with_format(value, date_format), date_format
+        except ValueError:
+            continue
+    raise ValueError(f"Formato de fecha no reconocido: {value}")
@@ -0,0 +1,17 @@
+"""Rangos de fechas usados para filtrar transacciones por período"""
+
+from datetime import date
+from typing import Tuple
+
+
+def month_range(year: int, month: int) -> Tuple[date, date]:
+    """
+    Devuelve el rango semiabierto [inicio, fin) de un mes.
+
+    Se filtra con transaction_date >= inicio y transaction_date < fin (el
+    primer día del mes siguiente), así no hace falta calcular el último día
+    del mes y el filtro es un rango simple sobre el índice de la fecha.
+    """
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
@@ -0,0 +1,39 @@
+"""Validación condicional (ETag / If-None-Match) para listados de solo lectura"""
+
+import hashlib
+
+from fastapi import Request, Response
+
+
+def compute_etag(*parts) -> str:
+    """
+    Calcula un ETag débil a partir de los valores que identifican una versión del listado.
+
+    Args:
+        *parts: Valores que cambian cuando cambia el contenido (última
+            actualización, cantidad de filas, parámetros de paginación, etc.)
+
+    Returns:
+        str: ETag débil con el formato W/"<hash>"
+    """
+    payload = "|".join(str(part) for part in parts).encode()
+    return f'W/"{hashlib.blake2b(payload, digest_size=8).hexdigest()}"'
+
+
+def not_modified_response(request: Request, etag: str):
+    """
+    Devuelve una respuesta 304 si el cliente ya tiene la versión indicada por el ETag.
+
+    Returns:
+        Response | None: Respuesta 304 lista para devolver, o None si hay que
+        generar el listado completo
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+
+    # La comparación de ETags en If-None-Match es débil: se ignora el prefijo W/
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    if "*" in candidates or etag.removeprefix("W/") in candidates:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
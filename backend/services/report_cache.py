@@ -0,0 +1,156 @@
+"""
+Caché de reportes bancarios ya procesados.
+
+Es común volver a subir la misma cartola (reintentos, revisión de la
+conciliación), y leer el Excel con pandas es lo más costoso de la carga.
+Se guarda la respuesta JSON ya serializada, por banco, versión de los
+extractores y huella del contenido del archivo, en dos niveles: un LRU en memoria y un directorio
+en disco que sobrevive a reinicios y se comparte entre procesos.
+
+El directorio en disco es privado del usuario que ejecuta la API (modo
+0700): si no lo es, no se usa, para no servir respuestas que otro usuario
+haya dejado ahí.
+"""
+
+import hashlib
+import os
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Cantidad máxima de reportes guardados en memoria; al superarla se
+# descarta el menos usado
+REPORT_CACHE_SIZE = 32
+
+# Directorio y cantidad máxima de reportes guardados en disco; al superarla
+# se eliminan los más antiguos (según su fecha de escritura)
+REPORT_CACHE_DIR = os.getenv(
+    "REPORT_CACHE_DIR",
+    os.path.join(
+        os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+        "contable", "report-cache"
+    )
+)
+REPORT_CACHE_MAX_FILES = int(os.getenv("REPORT_CACHE_MAX_FILES", "256"))
+
+# Segundos que un reporte en disco sigue siendo válido desde que se escribió
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", str(7 * 24 * 60 * 60)))
+
+# Tamaño de bloque al calcular la huella de un archivo en disco
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+_reports: "OrderedDict[tuple, bytes]" = OrderedDict()
+# Las funciones se ejecutan en el threadpool (hacen E/S de disco)
+_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """
+    Calcula la huella del contenido de un reporte subido.
+
+    Args:
+        path: Ruta del archivo temporal en disco
+
+    Returns:
+        str: Huella hexadecimal del contenido
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_dir() -> Optional[str]:
+    """
+    Crea el directorio del caché en disco y verifica que sea privado.
+
+    Returns:
+        La ruta del directorio, o None si no es un directorio propio sin
+        permisos para el grupo ni otros usuarios (el caché en disco no se usa)
+    """
+    try:
+        os.makedirs(REPORT_CACHE_DIR, mode=0o700, exist_ok=True)
+        info = os.lstat(REPORT_CACHE_DIR)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(info.st_mode) or info.st_mode & 0o077:
+        return None
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        return None
+    return REPORT_CACHE_DIR
+
+
+def _cache_path(directory: str, bank_id: str, version: int, digest: str) -> str:
+    """Ruta del archivo en disco de un reporte"""
+    return os.path.join(directory, f"{bank_id}_v{version}_{digest}.json")
+
+
+def _remember(key: tuple, body: bytes) -> None:
+    """Guarda la respuesta en el LRU en memoria"""
+    with _lock:
+        _reports[key] = body
+        _reports.move_to_end(key)
+        while len(_reports) > REPORT_CACHE_SIZE:
+            _reports.popitem(last=False)
+
+
+def get_cached_report(bank_id: str, version: int, digest: str) -> Optional[bytes]:
+    """Devuelve la respuesta JSON si el archivo ya se procesó con esa versión, o None"""
+    key = (bank_id, version, digest)
+    with _lock:
+        body = _reports.get(key)
+        if body is not None:
+            _reports.move_to_end(key)
+            return body
+
+    directory = _cache_dir()
+    if directory is None:
+        return None
+    path = _cache_path(directory, bank_id, version, digest)
+    try:
+        with open(path, "rb") as f:
+            if time.time() - os.fstat(f.fileno()).st_mtime > REPORT_CACHE_TTL:
+                return None
+            body = f.read()
+    except OSError:
+        return None
+    _remember(key, body)
+    return body
+
+
+def store_report(bank_id: str, version: int, digest: str, body: bytes) -> None:
+    """Guarda la respuesta JSON de un reporte en memoria y en disco"""
+    _remember((bank_id, version, digest), body)
+
+    directory = _cache_dir()
+    if directory is None:
+        return
+
+    # Escritura atómica: el archivo final solo aparece completo
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        os.replace(temp_path, _cache_path(directory, bank_id, version, digest))
+        _evict_old_files(directory)
+    except OSError:
+        # El caché en disco es opcional: si falla, queda el de memoria
+        pass
+
+
+def _evict_old_files(directory: str) -> None:
+    """Elimina los reportes en disco vencidos y los más antiguos si se supera el máximo"""
+    with os.scandir(directory) as entries:
+        files = [entry for entry in entries if entry.name.endswith(".json")]
+    files.sort(key=lambda entry: entry.stat().st_mtime)
+    expired_before = time.time() - REPORT_CACHE_TTL
+    expired = sum(1 for entry in files if entry.stat().st_mtime < expired_before)
+    for entry in files[:max(expired, len(files) - REPORT_CACHE_MAX_FILES)]:
+        try:
+            os.unlink(entry.path)
+        except OSError:
+            pass
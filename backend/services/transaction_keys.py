@@ -0,0 +1,132 @@
+"""Claves (fecha, descripción, monto) para detectar transacciones duplicadas en las cargas masivas"""
+
+import logging
+from decimal import Decimal
+from typing import List, Sequence, Set, Tuple
+
+from tortoise import connections
+from tortoise.transactions import in_transaction
+
+logger = logging.getLogger(__name__)
+
+# Cantidad máxima de claves por consulta en las búsquedas por (fecha, descripción, monto)
+KEY_LOOKUP_CHUNK_SIZE = 1000
+
+# Filas por cada INSERT múltiple en las cargas masivas
+BULK_CREATE_BATCH_SIZE = 1000
+
+# Las columnas de monto son DECIMAL(_, 2): el valor se compara como lo guarda MySQL
+AMOUNT_QUANTUM = Decimal("0.01")
+
+
+def normalize_amount(amount) -> Decimal:
+    """Convierte un monto (float, Decimal o texto) al DECIMAL con 2 decimales que guarda la base"""
+    return Decimal(str(amount)).quantize(AMOUNT_QUANTUM)
+
+
+def row_key(row: dict) -> tuple:
+    """Clave exacta (fecha, descripción, monto) de una fila del lote o leída de la base"""
+    return (row["transaction_date"], row["description"], normalize_amount(row["amount"]))
+
+
+async def find_existing_positions(model, keys: Sequence[tuple]) -> Set[int]:
+    """
+    Busca qué claves (fecha, descripción, monto) del lote ya existen en la tabla.
+
+    Las claves se envían como una tabla derivada con su posición en el lote y
+    se cruzan con la tabla en MySQL, así la comparación de descripciones usa
+    la intercalación de la columna (igual que un filter(...) por fila), sin
+    reproducirla en Python.
+
+    Returns:
+        Posiciones (índices en keys) cuya clave ya existe en la tabla.
+    """
+    connection = connections.get("default")
+    positions = set()
+    for start in range(0, len(keys), KEY_LOOKUP_CHUNK_SIZE):
+        chunk = keys[start:start + KEY_LOOKUP_CHUNK_SIZE]
+        batch = " UNION ALL ".join(
+            ["SELECT %s AS position, %s AS transaction_date, %s AS description, %s AS amount"]
+            * len(chunk)
+        )
+        params = []
+        for position, key in enumerate(chunk, start):
+            params.extend((position, *key))
+        rows = await connection.execute_query_dict(
+            f"SELECT DISTINCT batch.position FROM ({batch}) AS batch "
+            f"JOIN {model._meta.db_table} AS existing "
+            f"ON existing.transaction_date = batch.transaction_date "
+            f"AND existing.description = batch.description "
+            f"AND existing.amount = batch.amount",
+            params
+        )
+        positions.update(row["position"] for row in rows)
+    return positions
+
+
+async def last_id(model, connection) -> int:
+    """Mayor ID de la tabla del modelo (0 si está vacía), leído en la conexión indicada"""
+    ids = await model.all().using_db(connection).order_by("-id").limit(1).values_list("id", flat=True)
+    return ids[0] if ids else 0
+
+
+async def find_rows_after_id(model, after_id: int, fields: Sequence[str]) -> List[dict]:
+    """
+    Lee las filas de un modelo con ID mayor al indicado, ordenadas por ID.
+
+    Los valores se leen crudos (sin pasar por los campos del modelo), así el
+    monto conserva los decimales de la columna para compararlo con la clave.
+    """
+    return await connections.get("default").execute_query_dict(
+        f"SELECT {', '.join(fields)} FROM {model._meta.db_table} WHERE id > %s ORDER BY id",
+        [after_id]
+    )
+
+
+async def insert_new_rows(model, rows: List[dict]) -> Tuple[List[int], int]:
+    """
+    Inserta las filas de una carga masiva que no estén ya en la tabla.
+
+    Una fila es duplicada si MySQL encuentra su clave (fecha, descripción,
+    monto) en la tabla, o si la misma clave exacta aparece antes en el lote.
+    Las nuevas se insertan con un INSERT múltiple por bloque, todos en una
+    sola transacción.
+
+    Args:
+        model: Modelo de Tortoise de la tabla
+        rows: Valores de los campos de cada fila, en el orden recibido
+
+    Returns:
+        Tupla (IDs de las filas insertadas en orden, cantidad de duplicadas)
+    """
+    keys = [row_key(row) for row in rows]
+    existing_positions = await find_existing_positions(model, keys)
+
+    new_objects = []
+    new_keys = set()
+    duplicates_count = 0
+    for position, (row, key) in enumerate(zip(rows, keys)):
+        if position in existing_positions or key in new_keys:
+            duplicates_count += 1
+            logger.info("Transacción duplicada en %s: %s", model.__name__, row)
+            continue
+        new_keys.add(key)
+        new_objects.append(model(**row))
+
+    if not new_objects:
+        return [], duplicates_count
+
+    async with in_transaction() as connection:
+        previous_last_id = await last_id(model, connection)
+        await model.bulk_create(
+            new_objects, batch_size=BULK_CREATE_BATCH_SIZE, using_db=connection
+        )
+
+    # MySQL no devuelve los IDs de un INSERT múltiple: se leen las filas creadas
+    # después del último ID previo cuya clave exacta es del lote (descarta filas
+    # insertadas a la vez por otras peticiones)
+    inserted_rows = await find_rows_after_id(
+        model, previous_last_id, ("id", "transaction_date", "description", "amount")
+    )
+    new_ids = [row["id"] for row in inserted_rows if row_key(row) in new_keys]
+    return new_ids, duplicates_count
@@ -0,0 +1,11 @@
+USE moneydairy_db;
+
+-- Índice compuesto para listar categorías por padre y calcular su última
+-- actualización (ETag de los listados) sin leer la tabla
+CREATE INDEX idx_categories_parent_updated ON categories(parent_id, updated_at);
+
+-- Las búsquedas por (budget_id, category_id) ya se resuelven con las claves
+-- únicas unique_budget_category y unique_subcategory_budget. El índice simple
+-- por budget_id es un prefijo redundante de unique_subcategory_budget y solo
+-- encarece las escrituras
+DROP INDEX idx_subcategory_budgets_budget ON subcategory_budgets;
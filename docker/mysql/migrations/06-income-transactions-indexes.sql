@@ -0,0 +1,8 @@
+USE moneydairy_db;
+
+-- Índice compuesto para transacciones de ingreso: el filtro por rango de
+-- fechas del listado mensual usa su prefijo (transaction_date) y entrega las
+-- filas ya ordenadas; la búsqueda de duplicados de la carga masiva por
+-- (transaction_date, description, amount) se resuelve completa en el índice
+CREATE INDEX idx_income_date_description_amount
+    ON transacciones_ingresos (transaction_date, description, amount);